@@ -1,259 +1,225 @@
-from datetime import datetime, time
-from time import sleep
-import requests
-import xlwings as xw
+from datetime import datetime
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from archive import SnapshotArchive
+from chain_analytics import analyseWindow, parseAndAnalyse
+from chain_parser import STRIKE_WINDOW
+import metrics
+from nse_client import getClient
+from resample import DAY, Resampler
+from scheduler import Scheduler, futuresExpiryText, monthlyExpiry
+from signals import interpretTick
+from state_store import TICK, StateStore
+from sinks import ROLL_TICKS, Sink, ParquetSink, QueuedSink, writeTo
+
+#xlwings starts talking to Excel on import, so it is only imported once an Excel sink is used
+xw = None
+
+def loadXlwings():
+    global xw
+    if xw is None:
+        import xlwings
+        xw = xlwings
+    return xw
+
+SYMBOL = "NIFTY"
+BAR_MINUTES = (15, 30, 60, DAY)
 
 #Function to add Strike Price sheet in OptionChain.xlsx
 def addStrikePriceSheet(wb,strikePrice):
-    wb = xw.Book('OptionChain.xlsx')
+    wb = loadXlwings().Book('OptionChain.xlsx')
     wb.sheets.add(name=str(strikePrice))
 
-#Function add different option strike data in respective option strike sheet
-def addOptionDataInSheet(wb,currTime,strikePrice,ceLTP,ceOI,peLTP,peOI):
-    wb = xw.Book('OptionChain.xlsm')
-    wb_sheet = wb.sheets['Master']
+#Function to build Master sheet rows (Time, CE LTP, CE OI, Strike, PE LTP, PE OI, CE OI Change, PE OI Change)
+#of the nearest expiry for one tick, changes are since the previous tick.
+#The nearest expiry is a contiguous block of the (windowed) chain, so its columns are views, not copies.
+def optionChainRows(chain,currTime):
+    near = chain.select(chain.expirySlice(chain.filteredExpiry))
+    return [[currTime] + list(values) for values in zip(
+        near.ceLTP.tolist(), (75*near.ceOI).tolist(), near.strike.tolist(),
+        near.peLTP.tolist(), (75*near.peOI).tolist(),
+        (75*near.ceOIDelta).tolist(), (75*near.peOIDelta).tolist())]
+
+#Function to find the last filled row of column A with one Excel call instead of a scan
+def lastUsedRow(wb_sheet):
     if wb_sheet.cells(2, 1).value == None:
-        lastRow = 1
-    else:
-        lastRow = wb_sheet.range('A1').end('down').row
-        print(lastRow)
-
-    wb_sheet.cells(lastRow + 1, 1).value = currTime
-    wb_sheet.cells(lastRow + 1, 2).value = ceLTP
-    wb_sheet.cells(lastRow + 1, 3).value = ceOI
-    wb_sheet.cells(lastRow + 1, 4).value = strikePrice
-    wb_sheet.cells(lastRow + 1, 5).value = peLTP
-    wb_sheet.cells(lastRow + 1, 6).value = peOI
-    #Color strike Price
-    wb_sheet.range(lastRow+1, 4).color = (255, 255, 0)
+        return 1
+    return wb_sheet.range('A1').end('down').row
+
+#Writes a whole tick of option chain data in Master sheet as one range assignment.
+#Append row is tracked here so the sheet is scanned only once per run.
+class OptionChainWriter:
+    def __init__(self,fileName='OptionChain.xlsm',sheetName='Master'):
+        self.fileName = fileName
+        self.sheetName = sheetName
+        self.lastRow = None
+
+    def findLastRow(self,wb_sheet):
+        return lastUsedRow(wb_sheet)
+
+    def write(self,rows):
+        wb = loadXlwings().Book(self.fileName)
+        if rows:
+            wb_sheet = wb.sheets[self.sheetName]
+            if self.lastRow is None:
+                self.lastRow = self.findLastRow(wb_sheet)
+                wb_sheet.range('G1').value = [["CE OI Change", "PE OI Change"]]
+            firstRow = self.lastRow + 1
+            lastRow = self.lastRow + len(rows)
+            wb_sheet.range((firstRow, 1)).value = rows
+            #Color strike Price column of the whole block
+            wb_sheet.range((firstRow, 4), (lastRow, 4)).color = (255, 255, 0)
+            self.lastRow = lastRow
+        wb.save()
+
+optionChainWriter = OptionChainWriter()
 
 #Function make excel sheet if not present already
-def makeOptionChainFile(opt,currTime):
-    wb = xw.Book('OptionChain.xlsm')
-    optionData = opt["filtered"]["data"]
-
-    #Create Strike Price worksheet
-    for optionRow in optionData:
-        strikePrice = optionRow["CE"]["strikePrice"]
-        ceLTP = optionRow["CE"]["lastPrice"]
-        ceOI = 75*optionRow["CE"]["openInterest"]
-        peLTP = optionRow["PE"]["lastPrice"]
-        peOI = 75*optionRow["PE"]["openInterest"]
-        addOptionDataInSheet(wb,currTime,strikePrice,ceLTP,ceOI,peLTP,peOI)
-    wb.save()
+def makeOptionChainFile(chain,currTime):
+    optionChainWriter.write(optionChainRows(chain,currTime))
 
 #Function to add data in optionchain.xlsm
-def putOptionChainData(opt,currTime):
-    wb = xw.Book('OptionChain.xlsm')
-    optionData = opt["filtered"]["data"]
-    for optionRow in optionData:
-        strikePrice = optionRow["CE"]["strikePrice"]
-        ceLTP = optionRow["CE"]["lastPrice"]
-        ceOI = 75*optionRow["CE"]["openInterest"]
-        peLTP = optionRow["PE"]["lastPrice"]
-        peOI = 75*optionRow["PE"]["openInterest"]
-        addOptionDataInSheet(wb,currTime,strikePrice,ceLTP,ceOI,peLTP,peOI)
-    wb.save()
-
-#Function to add 5 min data inside OiAnalysis.xlsx
-def putInExcel5Min(currTraded, futOI, tradedVolCon, callOI, putOI,currTime):
-
-    wb =xw.Book('OiAnalysis.xlsx')
-    wb_sheet = wb.sheets[0]
-    lastRow = wb_sheet.range('A1').end('down').row
-    last_time = wb_sheet.cells(lastRow, 1).value
-    last_timee = last_time.split('-')
-    time_range = last_timee[1] + "-" + currTime
-    last_traded_price = wb_sheet.cells(lastRow, 2).value
-    changeInLTP = currTraded - last_traded_price
-    last_Fut_OI = wb_sheet.cells(lastRow,5).value
-    changeInFutOI = futOI - last_Fut_OI
-    last_Call_OI = wb_sheet.cells(lastRow, 7).value
-    changeInCallOI = callOI - last_Call_OI
-    last_Put_OI = wb_sheet.cells(lastRow,9).value
-    changeInPutOI = putOI - last_Put_OI
-    OiInter = ""
-    signal = ""
+def putOptionChainData(chain,currTime):
+    optionChainWriter.write(optionChainRows(chain,currTime))
+
+#Function to add a 5 min (sheet 0) or 15 min (sheet 1) row inside OiAnalysis.xlsx.
+#Changes come with snap from the state store, so nothing is read back from the sheet.
+def putInExcelRow(sheetIndex, row, snap):
+    wb = loadXlwings().Book('OiAnalysis.xlsx')
+    wb_sheet = wb.sheets[sheetIndex]
+    time_range = snap["lastTime"] + "-" + snap["currTime"]
+    changeInLTP = snap["changeInLTP"]
+    changeInFutOI = snap["changeInFutOI"]
+    changeInCallOI = snap["changeInCallOI"]
+    changeInPutOI = snap["changeInPutOI"]
+    OiInter, signal = interpretTick(changeInLTP, changeInFutOI, changeInCallOI, changeInPutOI)
     redFill = (255,204,203)
     greenFill = (144,238,144)
 
-    if changeInLTP > 0 and changeInFutOI > 0:
-        OiInter = "Long Buildup"
-    elif changeInLTP < 0 and changeInFutOI > 0:
-        OiInter = "Short Buildup"
-    elif changeInLTP < 0 and changeInFutOI < 0:
-        OiInter = "Long Unwinding"
-    elif changeInLTP > 0 and changeInFutOI < 0:
-        OiInter = "Short Covering"
-
-    if changeInLTP>0 and changeInFutOI>0 and changeInPutOI>0 and changeInCallOI<0:
-        signal = "Buy"
-    elif changeInLTP<0 and changeInFutOI>0 and changeInPutOI<0 and changeInCallOI>0:
-        signal = "Sell"
-    elif changeInLTP<0 and changeInFutOI<0 and changeInPutOI<0 and changeInCallOI>0:
-        signal = "Sell"
-    elif changeInLTP>0 and changeInFutOI<0 and changeInPutOI>0 and changeInCallOI<0:
-        signal = "Buy"
-
     #color filling start
-    if changeInLTP>0:
-        wb_sheet.range(lastRow + 1, 3).color = greenFill
-    elif changeInLTP<0:
-        wb_sheet.range(lastRow + 1, 3).color = redFill
-
-    if changeInFutOI>0:
-        wb_sheet.range(lastRow + 1, 6).color = greenFill
-    elif changeInFutOI<0:
-        wb_sheet.range(lastRow + 1, 6).color = redFill
-
-    if changeInCallOI>0:
-        wb_sheet.range(lastRow + 1, 8).color = greenFill
-    elif changeInCallOI<0:
-        wb_sheet.range(lastRow + 1, 8).color = redFill
-
-    if changeInPutOI>0:
-        wb_sheet.range(lastRow + 1, 10).color = greenFill
-    elif changeInPutOI<0:
-        wb_sheet.range(lastRow + 1, 10).color = redFill
+    for col, change in ((3, changeInLTP), (6, changeInFutOI), (8, changeInCallOI), (10, changeInPutOI)):
+        if change > 0:
+            wb_sheet.range(row, col).color = greenFill
+        elif change < 0:
+            wb_sheet.range(row, col).color = redFill
 
     if signal=="Buy":
-        wb_sheet.range(lastRow + 1, 12).color = greenFill
+        wb_sheet.range(row, 12).color = greenFill
     elif signal=="Sell":
-        wb_sheet.range(lastRow + 1, 12).color = redFill
-
-    wb_sheet.cells(lastRow+1, 1).value = time_range
-    wb_sheet.cells(lastRow+1, 2).value = currTraded
-    wb_sheet.cells(lastRow+1, 3).value = changeInLTP
-    wb_sheet.cells(lastRow+1, 4).value = tradedVolCon
-    wb_sheet.cells(lastRow+1, 5).value = futOI
-    wb_sheet.cells(lastRow+1, 6).value = changeInFutOI
-    wb_sheet.cells(lastRow+1, 7).value = callOI
-    wb_sheet.cells(lastRow+1, 8).value = changeInCallOI
-    wb_sheet.cells(lastRow+1, 9).value = putOI
-    wb_sheet.cells(lastRow+1, 10).value = changeInPutOI
-    wb_sheet.cells(lastRow + 1, 11).value = OiInter
-    wb_sheet.cells(lastRow + 1, 12).value = signal
+        wb_sheet.range(row, 12).color = redFill
+
+    wb_sheet.range((row, 1)).value = [[time_range, snap["lastTraded"], changeInLTP, snap["tradedVolCon"],
+                                       snap["futOI"], changeInFutOI, snap["callOI"], changeInCallOI,
+                                       snap["putOI"], changeInPutOI, OiInter, signal]]
     wb.save()
-    print(time_range,"    ",currTraded,"    ",changeInLTP,"     ",OiInter,"      ",signal)
-
-
-#Function to add 15 min data inside OiAnalysis.xlsx
-def putInExcel15Min(currTraded, futOI, tradedVolCon, callOI, putOI,currTime):
-    wb = xw.Book('OiAnalysis.xlsx')
-    wb_sheet = wb.sheets[1]
-    lastRow = wb_sheet.range('A1').end('down').row
-    last_time = wb_sheet.cells(lastRow, 1).value
-    last_timee = last_time.split('-')
-    time_range = last_timee[1] + "-" + currTime
-    last_traded_price = wb_sheet.cells(lastRow, 2).value
-    changeInLTP = currTraded - last_traded_price
-    last_Fut_OI = wb_sheet.cells(lastRow, 5).value
-    changeInFutOI = futOI - last_Fut_OI
-    last_Call_OI = wb_sheet.cells(lastRow, 7).value
-    changeInCallOI = callOI - last_Call_OI
-    last_Put_OI = wb_sheet.cells(lastRow, 9).value
-    changeInPutOI = putOI - last_Put_OI
-    OiInter = ""
-    signal = ""
-    redFill = (255, 204, 203)
-    greenFill = (144, 238, 144)
-
-    if changeInLTP > 0 and changeInFutOI > 0:
-        OiInter = "Long Buildup"
-    elif changeInLTP < 0 and changeInFutOI > 0:
-        OiInter = "Short Buildup"
-    elif changeInLTP < 0 and changeInFutOI < 0:
-        OiInter = "Long Unwinding"
-    elif changeInLTP > 0 and changeInFutOI < 0:
-        OiInter = "Short Covering"
-
-    if changeInLTP > 0 and changeInFutOI > 0 and changeInPutOI > 0 and changeInCallOI < 0:
-        signal = "Buy"
-    elif changeInLTP < 0 and changeInFutOI > 0 and changeInPutOI < 0 and changeInCallOI > 0:
-        signal = "Sell"
-    elif changeInLTP < 0 and changeInFutOI < 0 and changeInPutOI < 0 and changeInCallOI > 0:
-        signal = "Sell"
-    elif changeInLTP > 0 and changeInFutOI < 0 and changeInPutOI > 0 and changeInCallOI < 0:
-        signal = "Buy"
-
-    # color filling start
-    if changeInLTP > 0:
-        wb_sheet.range(lastRow + 1, 3).color = greenFill
-    elif changeInLTP < 0:
-        wb_sheet.range(lastRow + 1, 3).color = redFill
-
-    if changeInFutOI > 0:
-        wb_sheet.range(lastRow + 1, 6).color = greenFill
-    elif changeInFutOI < 0:
-        wb_sheet.range(lastRow + 1, 6).color = redFill
-
-    if changeInCallOI > 0:
-        wb_sheet.range(lastRow + 1, 8).color = greenFill
-    elif changeInCallOI < 0:
-        wb_sheet.range(lastRow + 1, 8).color = redFill
-
-    if changeInPutOI > 0:
-        wb_sheet.range(lastRow + 1, 10).color = greenFill
-    elif changeInPutOI < 0:
-        wb_sheet.range(lastRow + 1, 10).color = redFill
-
-    if signal == "Buy":
-        wb_sheet.range(lastRow + 1, 12).color = greenFill
-    elif signal == "Sell":
-        wb_sheet.range(lastRow + 1, 12).color = redFill
-
-    wb_sheet.cells(lastRow + 1, 1).value = time_range
-    wb_sheet.cells(lastRow + 1, 2).value = currTraded
-    wb_sheet.cells(lastRow + 1, 3).value = changeInLTP
-    wb_sheet.cells(lastRow + 1, 4).value = tradedVolCon
-    wb_sheet.cells(lastRow + 1, 5).value = futOI
-    wb_sheet.cells(lastRow + 1, 6).value = changeInFutOI
-    wb_sheet.cells(lastRow + 1, 7).value = callOI
-    wb_sheet.cells(lastRow + 1, 8).value = changeInCallOI
-    wb_sheet.cells(lastRow + 1, 9).value = putOI
-    wb_sheet.cells(lastRow + 1, 10).value = changeInPutOI
-    wb_sheet.cells(lastRow + 1, 11).value = OiInter
-    wb_sheet.cells(lastRow + 1, 12).value = signal
+    if sheetIndex == 0:
+        print(time_range,"    ",snap["lastTraded"],"    ",changeInLTP,"     ",OiInter,"      ",signal)
+
+#Function to turn a row of top strikes into text like "12000, 11500", NaN strikes are left out
+def wallText(strikes):
+    return ", ".join(str(int(s)) for s in strikes if s == s)
+
+#Function to round metrics for Excel, NaN becomes an empty cell
+def excelNumbers(values):
+    return [None if v != v else round(v, 2) for v in values.tolist()]
+
+#Function to write the per expiry option metrics of the latest tick in the Analytics sheet,
+#one row per expiry, replacing the previous tick's table in one range assignment
+def putAnalyticsData(analytics):
+    wb = loadXlwings().Book('OiAnalysis.xlsx')
+    wb_sheet = wb.sheets['Analytics']
+    header = ["Expiry", "PCR (OI)", "PCR (Volume)", "Max Pain", "CE OI Walls", "PE OI Walls",
+              "CE OI Change Walls", "PE OI Change Walls", "ATM IV", "OTM Put IV", "OTM Call IV", "IV Skew", "GEX"]
+    walls = {name: [wallText(row) for row in analytics[name]] for name in ("topCeOI", "topPeOI", "topCeChgOI", "topPeChgOI")}
+    rows = [list(row) for row in zip(analytics["expiry"].tolist(), excelNumbers(analytics["pcrOI"]), excelNumbers(analytics["pcrVol"]),
+                                     analytics["maxPain"].tolist(), walls["topCeOI"], walls["topPeOI"],
+                                     walls["topCeChgOI"], walls["topPeChgOI"], excelNumbers(analytics["atmIV"]),
+                                     excelNumbers(analytics["otmPutIV"]), excelNumbers(analytics["otmCallIV"]), excelNumbers(analytics["ivSkew"]),
+                                     excelNumbers(analytics["gex"]))]
+    wb_sheet.clear_contents()
+    wb_sheet.range('A1').value = [header] + rows
+    wb_sheet.range('A1:M1').color = (255,255,0)
     wb.save()
 
-def enterInExcel(currTime,isFifteenMin):
-    try:
-        url1 = "https://www1.nseindia.com/live_market/dynaContent/live_watch/get_quote/ajaxFOGetQuoteJSON.jsp?underlying=NIFTY&instrument=FUTIDX&expiry=24SEP2020&type=SELECT&strike=11500.00"
-        referer = "https://www1.nseindia.com/live_market/dynaContent/live_watch/get_quote/GetQuoteFO.jsp?underlying=NIFTY&instrument=OPTIDX&expiry=17SEP2020&type=CE&strike=11500.00"
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/85.0.4183.102 Safari/537.36',
-            'Accept-Language': 'en-US,en;q=0.9', 'Accept-Encoding': 'gzip, deflate, br', 'referer': referer}
-        cookies = {
-            'bm_sv': '808AA9DAA6889DCF6CB5A9AB14BF290F~t420SFeAK8epqchwzNEdgzJGSy4pjs8Mco4O/d7w5qW4TxShiDJYDHoeSAe60uaZMH2n5wjH3v0NnmtPWrKZosEZDfOSHts34ur4GGAPsGGL3LHYVPU/IbcIDhNf6MXF8oqWfpyJ0FXh74VTcL2NhnLG6DlsLun9OrT/+t9vHpY='}
-        session = requests.session()
-        for cook in cookies:
-            session.cookies.set(cook, cookies[cook])
-
-        fut = session.get(url1, headers=headers).json()
-        url2 = "https://www.nseindia.com/api/option-chain-indices?symbol=NIFTY"
-        session = requests.session()
-
-        for cook in cookies:
-            session.cookies.set(cook, cookies[cook])
-        opt = session.get(url2, headers=headers).json()
-        # Future OI
-        lastTraded = float((fut["data"][0]["lastPrice"]).replace(',', ''))
-        futOI = int((fut["data"][0]["openInterest"]).replace(',', ''))
-        tradedVolCon = int((fut["data"][0]["numberOfContractsTraded"]).replace(',', ''))
-
-        # Option OI
-        callOI = opt["filtered"]["CE"]["totOI"]
-        putOI = opt["filtered"]["PE"]["totOI"]
-        putInExcel5Min(lastTraded, futOI, tradedVolCon, callOI, putOI,currTime)
-        putOptionChainData(opt,currTime)
-        if isFifteenMin:
-            putInExcel15Min(lastTraded, futOI, tradedVolCon, callOI, putOI,currTime)
-
-    except Exception as e:
-        print(e)
+#Function to pick the values stored every tick out of futures quote and option chain
+def futuresSnapshot(fut,chain,currTime,timestamp=None):
+    futData = fut["data"][0]
+    return {
+        "timestamp": (timestamp or datetime.now()).replace(microsecond=0),
+        "currTime": currTime,
+        "symbol": futData.get("underlying", "NIFTY"),
+        "expiry": futData["expiryDate"],
+        "lastTraded": float((futData["lastPrice"]).replace(',', '')),
+        "futOI": int((futData["openInterest"]).replace(',', '')),
+        "tradedVolCon": int((futData["numberOfContractsTraded"]).replace(',', '')),
+        "callOI": chain.filteredTotals["CE"]["totOI"],
+        "putOI": chain.filteredTotals["PE"]["totOI"],
+    }
+
+#Sink writing OiAnalysis.xlsx and OptionChain.xlsm through a live Excel instance.
+#The workbooks hold one underlying, ticks of other symbols are ignored.
+#An existing OiAnalysis.xlsx is opened as it is and appended to, so a restart mid-session continues the
+#day's sheets; they are only cleared when the baseline of a new day is written.
+class ExcelSink(Sink):
+    def __init__(self,symbol=SYMBOL):
+        self.symbol = symbol
+        #Last written row of the 5 min and 15 min sheets
+        self.rows = [1, 1]
+
+    def open(self):
+        if os.path.exists('OiAnalysis.xlsx'):
+            wb = loadXlwings().Book('OiAnalysis.xlsx')
+            self.rows = [lastUsedRow(wb.sheets[0]), lastUsedRow(wb.sheets[1])]
+            if 'Analytics' not in [sheet.name for sheet in wb.sheets]:
+                wb.sheets.add(name='Analytics', after=wb.sheets[-1])
+            return
+        wb = loadXlwings().Book()
+        wb.save('OiAnalysis.xlsx')
+        wb.sheets.add(name='Analytics')
+        wb.sheets.add(name='FiftMin')
+        wb.sheets.add(name='FiveMin')
+        for sheet in wb.sheets:
+            if 'Sheet' in sheet.name:
+                sheet.delete()
+
+    def writeBaseline(self,snap,chain):
+        if snap["symbol"] != self.symbol:
+            return
+        if self.rows != [1, 1]:
+            #Previous day's rows
+            wb = loadXlwings().Book('OiAnalysis.xlsx')
+            wb.sheets[0].clear()
+            wb.sheets[1].clear()
+        putInExcelIni(snap["lastTraded"], snap["futOI"], snap["tradedVolCon"], snap["callOI"], snap["putOI"], snap["currTime"])
+        self.rows = [2, 2]
+        makeOptionChainFile(chain, snap["currTime"])
+
+    def writeFutures(self,snap):
+        if snap["symbol"] != self.symbol:
+            return
+        self.rows[0] += 1
+        putInExcelRow(0, self.rows[0], snap)
+
+    def writeBar(self,symbol,minutes,bar):
+        if symbol != self.symbol or minutes != 15:
+            return
+        self.rows[1] += 1
+        putInExcelRow(1, self.rows[1], bar)
+
+    def writeOptionChain(self,snap,chain):
+        if snap["symbol"] != self.symbol:
+            return
+        putOptionChainData(chain, snap["currTime"])
+
+    def writeAnalytics(self,snap,analytics):
+        if snap["symbol"] != self.symbol:
+            return
+        putAnalyticsData(analytics)
 
 def putInExcelIni(lastTraded, futOI, tradedVolCon, callOI, putOI,currTime):
-    wb = xw.Book('OiAnalysis.xlsx')
+    wb = loadXlwings().Book('OiAnalysis.xlsx')
     sht5min = wb.sheets[0]
     sht15min = wb.sheets[1]
     sht5min.cells(1, 1).value = "Time"
@@ -309,72 +275,158 @@ def putInExcelIni(lastTraded, futOI, tradedVolCon, callOI, putOI,currTime):
     sht15min.cells(2, 10).value = 0
     wb.save()
 
-def initializeFiles(currTime):
-    try:
-        url1 = "https://www1.nseindia.com/live_market/dynaContent/live_watch/get_quote/ajaxFOGetQuoteJSON.jsp?underlying=NIFTY&instrument=FUTIDX&expiry=24SEP2020&type=SELECT&strike=11500.00"
-        referer = "https://www1.nseindia.com/live_market/dynaContent/live_watch/get_quote/GetQuoteFO.jsp?underlying=NIFTY&instrument=OPTIDX&expiry=17SEP2020&type=CE&strike=11500.00"
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/85.0.4183.102 Safari/537.36',
-            'Accept-Language': 'en-US,en;q=0.9', 'Accept-Encoding': 'gzip, deflate, br', 'referer': referer}
-        cookies = {
-            'bm_sv': '808AA9DAA6889DCF6CB5A9AB14BF290F~t420SFeAK8epqchwzNEdgzJGSy4pjs8Mco4O/d7w5qW4TxShiDJYDHoeSAe60uaZMH2n5wjH3v0NnmtPWrKZosEZDfOSHts34ur4GGAPsGGL3LHYVPU/IbcIDhNf6MXF8oqWfpyJ0FXh74VTcL2NhnLG6DlsLun9OrT/+t9vHpY='}
-        session = requests.session()
-        for cook in cookies:
-            session.cookies.set(cook, cookies[cook])
-
-        fut = session.get(url1, headers=headers).json()
-        url2 = "https://www.nseindia.com/api/option-chain-indices?symbol=NIFTY"
-        session = requests.session()
-
-        for cook in cookies:
-            session.cookies.set(cook, cookies[cook])
-        opt = session.get(url2, headers=headers).json()
-        # Future OI
-        lastTraded = float((fut["data"][0]["lastPrice"]).replace(',', ''))
-        futOI = int((fut["data"][0]["openInterest"]).replace(',', ''))
-        tradedVolCon = int((fut["data"][0]["numberOfContractsTraded"]).replace(',', ''))
-
-        # Option OI
-        callOI = opt["filtered"]["CE"]["totOI"]
-        putOI = opt["filtered"]["PE"]["totOI"]
-
-        putInExcelIni(lastTraded, futOI, tradedVolCon, callOI, putOI,currTime)
-        makeOptionChainFile(opt,currTime)
-        return True
-    except Exception as e:
-        print(e)
-        return False
+#Collects one underlying: fetches futures and option chain on every scheduler tick and hands them to the sinks.
+#The first tick of a day seeds the baseline row, the futures expiry rolls over on its own after expiry day.
+#15 min and longer bars are built from the tick stream on clock boundaries, not by counting ticks.
+#Changes against the previous row of every frame and per strike come from the shared StateStore.
+#Greeks of every leg and PCR, max pain, OI walls, IV skew and gamma exposure of every expiry are computed once per tick and sent to every sink.
+#Parsing, Greeks and analytics need no collector state and can run in a process pool.
+#Past the analytics only strikeWindow strikes either side of ATM of every expiry are kept (0 keeps the whole chain),
+#so per strike changes, Greeks, storage and the Master sheet scale with the window instead of the chain.
+class SymbolCollector:
+    def __init__(self,symbol,sinks,expiry=None,state=None,pool=None,archive=None,strikeWindow=STRIKE_WINDOW):
+        self.symbol = symbol
+        self.strikeWindow = strikeWindow
+        #Optional process pool for parsing and analytics, so symbols use every core
+        self.pool = pool
+        #Optional archive.SnapshotArchive keeping every raw payload
+        self.archive = archive
+        self.sinks = sinks
+        self.state = state if state is not None else StateStore()
+        self.fixedExpiry = expiry
+        self.expiryDates = []
+        #A restarted collector carries on with the day it already wrote a baseline for
+        self.baselineDay = self.state.baselineDay(symbol)
+        self.resampler = Resampler(BAR_MINUTES)
+        self.name = symbol
+
+    def futuresExpiry(self,day):
+        if self.fixedExpiry:
+            return self.fixedExpiry
+        return futuresExpiryText(monthlyExpiry(day, self.expiryDates))
+
+    def __call__(self,boundary):
+        with metrics.timeStage(self.symbol, "fetch"):
+            futRaw, raw = getClient().fetchFuturesAndOptionChain(self.symbol, self.futuresExpiry(boundary.date()), raw=True)
+        if self.archive is not None:
+            #The archive is a side store: a failed append is counted (stage "archive") and the tick goes on
+            try:
+                with metrics.timeStage(self.symbol, "archive"):
+                    self.archive.append(self.symbol, boundary, futRaw, raw)
+            except Exception as e:
+                print(self.symbol, "archive", e)
+        fut = json.loads(futRaw)
+        with metrics.timeStage(self.symbol, "parse"):
+            if self.pool is not None:
+                chain, analytics = self.pool.submit(parseAndAnalyse, raw, self.strikeWindow).result()
+            else:
+                chain, analytics = parseAndAnalyse(raw, self.strikeWindow)
+        return self.process(boundary, fut, chain, analytics)
+
+    #Function to run one fetched tick through snapshot, bars and sinks; also used by replay.py.
+    #chain comes straight from the parser unless analytics were computed with it by parseAndAnalyse.
+    def process(self,boundary,fut,chain,analytics=None):
+        with metrics.timeStage(self.symbol, "compute"):
+            if analytics is None:
+                chain, analytics = analyseWindow(chain, self.strikeWindow)
+            snap, closed, isBaseline = self.compute(boundary, fut, chain)
+        with metrics.timeStage(self.symbol, "write"):
+            for sink in self.sinks:
+                if isBaseline:
+                    writeTo(sink, "Baseline", snap, chain)
+                else:
+                    writeTo(sink, "Futures", snap)
+                    writeTo(sink, "OptionChain", snap, chain)
+                writeTo(sink, "Analytics", snap, analytics)
+                for minutes, bars in closed.items():
+                    for bar in bars:
+                        # The baseline tick only closes bars of the previous session, never one of its own
+                        if not isBaseline or bar["start"].date() < boundary.date():
+                            writeTo(sink, "Bar", self.symbol, minutes, bar)
+        self.baselineDay = boundary.date()
+        metrics.ticks.inc(symbol=self.symbol)
+        return snap
+
+    #Function to build the snapshot, closed bars and changes of one tick from the collector state
+    def compute(self,boundary,fut,chain):
+        currTime = str(boundary.hour) + ":" + str(boundary.minute)
+        self.expiryDates = chain.expiryDates
+        snap = futuresSnapshot(fut, chain, currTime, boundary)
+        closed = self.resampler.update(boundary, snap)
+        isBaseline = self.baselineDay != boundary.date()
+        for minutes, bars in closed.items():
+            for bar in bars:
+                end = bar["end"]
+                bar["currTime"] = str(end.hour) + ":" + str(end.minute)
+                bar.update(self.state.futuresChanges(self.symbol, minutes, bar))
+        if isBaseline:
+            snap.update(self.state.resetFutures(self.symbol, snap, BAR_MINUTES))
+        else:
+            snap.update(self.state.futuresChanges(self.symbol, TICK, snap))
+        chain.setDeltas(self.state.chainChanges(self.symbol, chain))
+        return snap, closed, isBaseline
+
+#Function to build a collector from SYMBOL or SYMBOL:EXPIRY (e.g. BANKNIFTY:24SEP2020 pins the futures expiry)
+def makeCollector(spec,sinks,state=None,pool=None,archive=None,strikeWindow=STRIKE_WINDOW):
+    symbol, _, expiry = spec.upper().partition(":")
+    return SymbolCollector(symbol, sinks, expiry or None, state, pool, archive, strikeWindow)
 
 
 if __name__ == '__main__':
-   success = False
-
-   wb = xw.Book()
-   wb.save('OiAnalysis.xlsx')
-   wb.sheets.add(name='FiftMin')
-   wb.sheets.add(name='FiveMin')
-   for sheet in wb.sheets:
-       if 'Sheet' in sheet.name:
-           sheet.delete()
-   # This loop runs from 9:15 AM to 3:30 PM till Market hours
-   while(1):
-        t1 = datetime.now()
-        currTime = str(t1.hour)+":"+str(t1.minute)
-        if(time(9,15)<=datetime.now().time()<=time(9,17,30) and not(success)):
-            success = initializeFiles(currTime)
-
-        isFifMin=1
-        while(time(9,20)<=datetime.now().time()<=time(15,31)):
-            t1 = datetime.now()
-            currTime = str(t1.hour) + ":" + str(t1.minute)
-            isFifMin+=1
-            isFifteenMin = False
-            if isFifMin==3:
-                isFifteenMin = True
-                isFifMin=0
-            enterInExcel(currTime,isFifteenMin)
-            t1 = datetime.now()
-            while(t1.minute%5 !=0 or t1.second !=0):
-                t1 = datetime.now()
-                sleep(1)
-        sleep(1)
\ No newline at end of file
+   parser = argparse.ArgumentParser(description="NSE futures and option chain OI collector")
+   parser.add_argument("--symbol", action="append",
+                       help="underlying to collect as SYMBOL or SYMBOL:EXPIRY, can be repeated (default: NIFTY)")
+   parser.add_argument("--sink", action="append", choices=["excel", "parquet"],
+                       help="where to store collected data, can be repeated (default: excel)")
+   parser.add_argument("--data-dir", default="data", help="root folder of the parquet store")
+   parser.add_argument("--parquet-roll", type=int, default=ROLL_TICKS,
+                       help="ticks per parquet part file, a crash loses at most this many ticks")
+   parser.add_argument("--interval", type=int, default=5, help="tick interval in minutes")
+   parser.add_argument("--state", default="collector_state.npz", help="checkpoint file of the last snapshot of every symbol")
+   parser.add_argument("--processes", type=int, default=0,
+                       help="parse and analyse option chains in this many worker processes and write every sink from its own queue")
+   parser.add_argument("--strike-window", type=int, default=STRIKE_WINDOW,
+                       help="strikes kept either side of ATM of every expiry, 0 keeps the whole chain")
+   parser.add_argument("--archive-dir", help="keep every raw payload in a compressed archive in this folder")
+   parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+   parser.add_argument("--metrics-file", help="also write Prometheus metrics to this file every 15 seconds")
+   args = parser.parse_args()
+   symbols = args.symbol or [SYMBOL]
+
+   sinks = []
+   state = StateStore(args.state)
+   pool = ProcessPoolExecutor(args.processes) if args.processes > 0 else None
+   archive = SnapshotArchive(args.archive_dir) if args.archive_dir else None
+   collectors = [makeCollector(spec, sinks, state, pool, archive, args.strike_window) for spec in symbols]
+   # Two requests in flight per underlying, so every symbol of a boundary fetches at the same time
+   getClient(2 * len(collectors))
+   for name in args.sink or ["excel"]:
+       if name == "excel":
+           # Excel workbooks hold a single underlying
+           sink = ExcelSink(collectors[0].symbol)
+       else:
+           sink = ParquetSink(args.data_dir, args.parquet_roll)
+       sinks.append(QueuedSink(sink) if pool is not None else sink)
+   for sink in sinks:
+       sink.open()
+   if args.metrics_port:
+       metrics.registry.serve(args.metrics_port)
+   if args.metrics_file:
+       metricsWriter = metrics.registry.writeEvery(args.metrics_file)
+
+   # One checkpoint of every symbol's state per boundary, once all collectors are done with it
+   scheduler = Scheduler(collectors, args.interval, afterBoundary=lambda boundary: state.checkpoint())
+   try:
+       # Ticks on every interval boundary from 9:15 AM to 3:30 PM till Market hours
+       scheduler.run()
+   except KeyboardInterrupt:
+       pass
+   finally:
+       scheduler.stop()
+       state.checkpoint()
+       for sink in sinks:
+           sink.close()
+       if pool is not None:
+           pool.shutdown()
+       if args.metrics_file:
+           metricsWriter.set()
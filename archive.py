@@ -0,0 +1,161 @@
+import argparse
+import hashlib
+import os
+import threading
+import zlib
+from datetime import datetime
+import numpy as np
+
+# Raw payloads of one underlying and day live in two append-only files under <root>/<SYMBOL>/:
+#   2020-09-11.arc   zlib-compressed futures and option chain payloads, back to back
+#   2020-09-11.idx   one fixed-size INDEX_DTYPE record per tick pointing into the .arc file
+# A payload identical to the previous one of its kind is not stored again; its index record points at
+# the earlier copy. Blobs are written before their index record, so a crash leaves at worst an unindexed
+# blob that is never read.
+ARCHIVE_SUFFIX = ".arc"
+INDEX_SUFFIX = ".idx"
+INDEX_DTYPE = np.dtype([("time", "<i8"), ("futOffset", "<i8"), ("futLength", "<i8"),
+                        ("optOffset", "<i8"), ("optLength", "<i8")])
+KINDS = ("fut", "opt")
+
+
+def digest(raw):
+    return hashlib.blake2b(raw, digest_size=16).digest()
+
+
+# Function to read the index records of one day file, a torn last record is ignored
+def readIndex(path):
+    if not os.path.exists(path):
+        return np.empty(0, dtype=INDEX_DTYPE)
+    count = os.path.getsize(path) // INDEX_DTYPE.itemsize
+    return np.fromfile(path, dtype=INDEX_DTYPE, count=count)
+
+
+def epochSeconds(moment):
+    return int(moment.replace(microsecond=0).timestamp())
+
+
+class SnapshotArchive:
+    def __init__(self, root="archive", level=6):
+        self.root = root
+        self.level = level
+        self.lock = threading.Lock()
+        # (symbol, kind) -> (digest, offset, length) of the last stored payload of today's file
+        self.last = {}
+        self.lastDay = {}
+
+    def paths(self, symbol, day):
+        base = os.path.join(self.root, symbol, day.strftime("%Y-%m-%d"))
+        return base + ARCHIVE_SUFFIX, base + INDEX_SUFFIX
+
+    # Function to pick up the last payloads of a day file written by an earlier run, for dedup
+    def resume(self, symbol, day):
+        self.lastDay[symbol] = day
+        arcPath, idxPath = self.paths(symbol, day)
+        index = readIndex(idxPath)
+        for kind in KINDS:
+            self.last.pop((symbol, kind), None)
+        if len(index) == 0:
+            return
+        record = index[-1]
+        with open(arcPath, "rb") as f:
+            for kind in KINDS:
+                offset, length = int(record[kind + "Offset"]), int(record[kind + "Length"])
+                f.seek(offset)
+                self.last[(symbol, kind)] = (digest(zlib.decompress(f.read(length))), offset, length)
+
+    # Function to store one tick's raw futures and option chain payloads
+    def append(self, symbol, timestamp, futRaw, optRaw):
+        day = timestamp.date()
+        arcPath, idxPath = self.paths(symbol, day)
+        with self.lock:
+            if self.lastDay.get(symbol) != day:
+                os.makedirs(os.path.dirname(arcPath), exist_ok=True)
+                self.resume(symbol, day)
+            record = np.zeros(1, dtype=INDEX_DTYPE)
+            record["time"] = epochSeconds(timestamp)
+            with open(arcPath, "ab") as f:
+                for kind, raw in zip(KINDS, (futRaw, optRaw)):
+                    key = digest(raw)
+                    previous = self.last.get((symbol, kind))
+                    if previous is not None and previous[0] == key:
+                        offset, length = previous[1], previous[2]
+                    else:
+                        blob = zlib.compress(raw, self.level)
+                        offset, length = f.tell(), len(blob)
+                        f.write(blob)
+                        self.last[(symbol, kind)] = (key, offset, length)
+                    record[kind + "Offset"] = offset
+                    record[kind + "Length"] = length
+            with open(idxPath, "ab") as f:
+                f.write(record.tobytes())
+
+    # Function to list the archived ticks of a symbol as (day, index records), days in order
+    def days(self, symbol, start=None, end=None):
+        folder = os.path.join(self.root, symbol)
+        names = sorted(os.listdir(folder)) if os.path.isdir(folder) else []
+        for name in names:
+            if not name.endswith(INDEX_SUFFIX):
+                continue
+            day = datetime.strptime(name[:-len(INDEX_SUFFIX)], "%Y-%m-%d").date()
+            if (start is None or day >= start.date()) and (end is None or day <= end.date()):
+                yield day, readIndex(os.path.join(folder, name))
+
+    def readRecord(self, symbol, day, record):
+        arcPath, _ = self.paths(symbol, day)
+        payloads = []
+        with open(arcPath, "rb") as f:
+            for kind in KINDS:
+                f.seek(int(record[kind + "Offset"]))
+                payloads.append(zlib.decompress(f.read(int(record[kind + "Length"]))))
+        return (datetime.fromtimestamp(int(record["time"])),) + tuple(payloads)
+
+    # Function to get the tick archived at or just before `moment` as (timestamp, futures bytes,
+    # option chain bytes), None if there is none that day. Binary search on the day's index.
+    def read(self, symbol, moment):
+        day = moment.date()
+        index = readIndex(self.paths(symbol, day)[1])
+        i = np.searchsorted(index["time"], epochSeconds(moment), side="right") - 1
+        if i < 0:
+            return None
+        return self.readRecord(symbol, day, index[i])
+
+    # Function to yield archived ticks between two datetimes (inclusive) in time order, in the
+    # (timestamp, futures bytes, option chain bytes) form replay.replay takes
+    def iterSnapshots(self, symbol, start=None, end=None):
+        for day, index in self.days(symbol, start, end):
+            times = index["time"]
+            first = 0 if start is None else np.searchsorted(times, epochSeconds(start), side="left")
+            last = len(index) if end is None else np.searchsorted(times, epochSeconds(end), side="right")
+            for record in index[first:last]:
+                yield self.readRecord(symbol, day, record)
+
+    # Function to get archived ticks, distinct stored payloads and bytes on disk of a symbol
+    def stats(self, symbol):
+        ticks = blobs = size = 0
+        for day, index in self.days(symbol):
+            ticks += len(index)
+            blobs += len(np.unique(index["futOffset"])) + len(np.unique(index["optOffset"]))
+            size += os.path.getsize(self.paths(symbol, day)[0])
+        return {"ticks": ticks, "storedPayloads": blobs, "bytes": size}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Inspect or extract archived raw NSE snapshots")
+    parser.add_argument("root", help="archive folder (OiAnalysis.py --archive-dir)")
+    parser.add_argument("--symbol", default="NIFTY")
+    parser.add_argument("--at", help="extract the tick at or before YYYY-MM-DD HH:MM")
+    parser.add_argument("--output", default=".", help="folder extracted payloads are written to")
+    args = parser.parse_args()
+
+    archive = SnapshotArchive(args.root)
+    if args.at:
+        tick = archive.read(args.symbol, datetime.strptime(args.at, "%Y-%m-%d %H:%M"))
+        if tick is None:
+            print("No tick archived at or before", args.at)
+        else:
+            from replay import saveSnapshot
+            saveSnapshot(args.output, args.symbol, tick[0], tick[1], tick[2], compress=False)
+            print("Extracted", tick[0], "to", os.path.join(args.output, args.symbol))
+    else:
+        print(archive.stats(args.symbol))
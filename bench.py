@@ -0,0 +1,354 @@
+import argparse
+import contextlib
+import copy
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import tempfile
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from time import perf_counter
+import numpy as np
+import OiAnalysis
+from chain_analytics import analyseChain, parseAndAnalyse
+from chain_parser import parseOptionChain
+from greeks import chainGreeks
+from resample import Resampler
+from signals import analyse
+from sinks import ParquetSink
+from state_store import TICK, StateStore
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TICKS_PER_DAY = 75
+
+
+# In-memory stand-in for the parts of xlwings the Excel sink uses, so the Excel path can be
+# timed headless. Every cells()/range() access counts as one Excel round-trip.
+class StubRange:
+    def __init__(self, sheet, first, last=None):
+        self.sheet = sheet
+        self.first = first
+        self.last = last or first
+        self.row = first[0]
+
+    @property
+    def value(self):
+        return self.sheet.values.get(self.first)
+
+    @value.setter
+    def value(self, value):
+        rows = value if isinstance(value, list) and value and isinstance(value[0], list) else [[value]]
+        for i, row in enumerate(rows):
+            for j, cell in enumerate(row):
+                self.sheet.values[(self.first[0] + i, self.first[1] + j)] = cell
+
+    @property
+    def color(self):
+        return None
+
+    @color.setter
+    def color(self, value):
+        self.sheet.colored += (self.last[0] - self.first[0] + 1) * (self.last[1] - self.first[1] + 1)
+
+    def end(self, direction):
+        self.sheet.calls += 1
+        col = self.first[1]
+        row = self.first[0]
+        while (row + 1, col) in self.sheet.values:
+            row += 1
+        return StubRange(self.sheet, (row, col))
+
+
+def cellAddress(text):
+    letters = "".join(c for c in text if c.isalpha())
+    col = 0
+    for c in letters.upper():
+        col = col * 26 + ord(c) - 64
+    return int(text[len(letters):]), col
+
+
+class StubSheet:
+    def __init__(self, book, name):
+        self.book = book
+        self.name = name
+        self.values = {}
+        self.colored = 0
+        self.calls = 0
+
+    def cells(self, row, col):
+        self.calls += 1
+        return StubRange(self, (row, col))
+
+    def range(self, first, last=None):
+        self.calls += 1
+        if isinstance(first, str):
+            parts = first.split(":")
+            return StubRange(self, cellAddress(parts[0]), cellAddress(parts[-1]))
+        if isinstance(first, int):
+            return StubRange(self, (first, last))
+        return StubRange(self, first, last)
+
+    def clear_contents(self):
+        self.calls += 1
+        self.values = {}
+
+    def clear(self):
+        self.clear_contents()
+
+    def delete(self):
+        self.book.sheets.items.remove(self)
+
+
+class StubSheets:
+    def __init__(self, book):
+        self.book = book
+        self.items = [StubSheet(book, "Sheet1")]
+
+    def add(self, name, before=None, after=None):
+        sheet = StubSheet(self.book, name)
+        self.items.insert(self.items.index(after) + 1 if after is not None else 0, sheet)
+        return sheet
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return self.items[key]
+        for sheet in self.items:
+            if sheet.name == key:
+                return sheet
+        return self.add(key)
+
+    def __iter__(self):
+        return iter(list(self.items))
+
+
+class StubXlwings:
+    def __init__(self):
+        self.books = {}
+
+    def Book(self, name=None):
+        if name is None:
+            return StubBook(self)
+        if name not in self.books:
+            self.books[name] = StubBook(self, name)
+        return self.books[name]
+
+    def calls(self):
+        return sum(sheet.calls for book in self.books.values() for sheet in book.sheets.items)
+
+
+class StubBook:
+    def __init__(self, xw, name=None):
+        self.xw = xw
+        self.name = name
+        self.sheets = StubSheets(self)
+
+    def save(self, name=None):
+        if name:
+            self.name = name
+            self.xw.books[name] = self
+
+
+# Function to build a synthetic option chain payload with `scale` times the strikes of OptionOI.json
+def scaledOptionChain(opt, scale):
+    if scale == 1:
+        return opt
+    opt = copy.deepcopy(opt)
+    rows = opt["records"]["data"]
+    span = max(r["strikePrice"] for r in rows) + 50
+    extra = []
+    for k in range(1, scale):
+        for row in rows:
+            row = copy.deepcopy(row)
+            row["strikePrice"] += k * span
+            for leg in ("CE", "PE"):
+                if leg in row:
+                    row[leg]["strikePrice"] = row["strikePrice"]
+                    row[leg]["identifier"] += "-" + str(k)
+            extra.append(row)
+    opt["records"]["data"] = rows + extra
+    return opt
+
+
+# Function to build per-tick futures payloads as a random walk around FutureOI.json
+def futuresSeries(fut, ticks, seed=7):
+    rng = random.Random(seed)
+    data = fut["data"][0]
+    ltp = float(data["lastPrice"].replace(",", ""))
+    oi = int(data["openInterest"].replace(",", ""))
+    series = []
+    for _ in range(ticks):
+        ltp += rng.uniform(-10, 10)
+        oi += rng.randint(-20000, 20000)
+        tick = copy.deepcopy(fut)
+        tick["data"][0]["lastPrice"] = "{:,.2f}".format(ltp)
+        tick["data"][0]["openInterest"] = "{:,}".format(oi)
+        series.append(tick)
+    return series
+
+
+def tickTimes(days, start=datetime(2020, 9, 14, 9, 15)):
+    times = []
+    for day in range(days):
+        base = start + timedelta(days=day)
+        times.extend(base + timedelta(minutes=5 * i) for i in range(TICKS_PER_DAY))
+    return times
+
+
+# Function to time fn over every item, returns per-call latency stats, throughput and peak memory
+# (tracemalloc sees Python allocations only, not Arrow buffers)
+def timeStage(name, fn, items, units=1):
+    latencies = np.empty(len(items))
+    for i, item in enumerate(items):
+        started = perf_counter()
+        fn(item)
+        latencies[i] = perf_counter() - started
+    tracemalloc.start()
+    fn(items[0])
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    total = latencies.sum()
+    return {
+        "stage": name,
+        "calls": len(items),
+        "meanMs": round(1000 * latencies.mean(), 3),
+        "p50Ms": round(1000 * np.percentile(latencies, 50), 3),
+        "p95Ms": round(1000 * np.percentile(latencies, 95), 3),
+        "perSec": round(len(items) * units / total, 1) if total else None,
+        "peakKiB": peak // 1024,
+    }
+
+
+# Function to measure how many raw option chains per second `workers` processes parse and analyse,
+# the way OiAnalysis.py --processes fans symbols out over cores
+def poolThroughput(raw, workers, count):
+    with ProcessPoolExecutor(workers) as pool:
+        list(pool.map(parseAndAnalyse, [raw] * workers))
+        started = perf_counter()
+        list(pool.map(parseAndAnalyse, [raw] * count))
+        total = perf_counter() - started
+    return {"stage": "parseAnalyse x" + str(workers), "calls": count, "meanMs": round(1000 * total / count, 3),
+            "p50Ms": None, "p95Ms": None, "perSec": round(count / total, 1), "peakKiB": None}
+
+
+def runBenchmarks(symbols, strikeScale, days, workers=(1,)):
+    with open(os.path.join(HERE, "FutureOI.json"), "rb") as f:
+        fut = json.load(f)
+    with open(os.path.join(HERE, "OptionOI.json"), "rb") as f:
+        opt = json.load(f)
+    raw = json.dumps(scaledOptionChain(opt, strikeScale)).encode()
+    times = tickTimes(days)
+    ticks = len(times) * symbols
+    futs = futuresSeries(fut, len(times))
+    chain = parseOptionChain(raw)
+    results = []
+
+    # Parsing is per tick per symbol; the same payload is reused
+    parseItems = [raw] * min(ticks, 200)
+    results.append(timeStage("parse", parseOptionChain, parseItems))
+
+    for n in workers:
+        results.append(poolThroughput(raw, n, min(ticks, 50 * n)))
+
+    results.append(timeStage("greeks", chainGreeks, [chain] * min(ticks, 200)))
+    chain.setGreeks(chainGreeks(chain))
+    results.append(timeStage("analytics", analyseChain, [chain] * min(ticks, 200)))
+
+    snaps = [OiAnalysis.futuresSnapshot(f, chain, "", t) for f, t in zip(futs, times)]
+    results.append(timeStage("snapshot", lambda item: OiAnalysis.futuresSnapshot(item[0], chain, "", item[1]),
+                             list(zip(futs, times))))
+
+    series = {name: np.array([s[name] for s in snaps], dtype=float) for name in ("lastTraded", "futOI", "callOI", "putOI")}
+    results.append(timeStage("signals", lambda item: analyse(series["lastTraded"], series["futOI"], series["callOI"], series["putOI"]),
+                             [None] * 20, units=len(snaps)))
+
+    resampler = Resampler()
+    results.append(timeStage("resample", lambda snap: resampler.update(snap["timestamp"], snap), snaps))
+
+    folder = tempfile.mkdtemp(prefix="oibench")
+    try:
+        sink = ParquetSink(folder)
+        items = [dict(snap, symbol="SYM" + str(i % symbols)) for i, snap in enumerate(snaps * symbols)][:2000]
+        results.append(timeStage("parquetSink", lambda snap: (sink.writeFutures(snap), sink.writeOptionChain(snap, chain)), items))
+        sink.close()
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    stub = StubXlwings()
+    realXw = OiAnalysis.xw
+    OiAnalysis.xw = stub
+    OiAnalysis.optionChainWriter.lastRow = None
+    try:
+        excel = OiAnalysis.ExcelSink()
+        excel.open()
+        state = StateStore()
+        excel.writeBaseline(dict(snaps[0], currTime="9:15"), chain)
+        items = []
+        for snap in snaps[:TICKS_PER_DAY]:
+            snap = dict(snap, currTime=snap["timestamp"].strftime("%H:%M"))
+            items.append(dict(snap, **state.futuresChanges(snap["symbol"], TICK, snap)))
+        items = items[1:]
+        callsBefore = stub.calls()
+        # putInExcel5Min prints every row
+        with contextlib.redirect_stdout(io.StringIO()):
+            results.append(timeStage("excelSink(stub)", lambda snap: (excel.writeFutures(snap), excel.writeOptionChain(snap, chain)), items))
+        results[-1]["excelCallsPerTick"] = round((stub.calls() - callsBefore) / (len(items) + 1), 1)
+    finally:
+        OiAnalysis.xw = realXw
+
+    return results
+
+
+def gitVersion():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Function to find the last saved run with the same parameters, to show regressions
+def previousRun(path, params):
+    if not os.path.exists(path):
+        return None
+    last = None
+    with open(path) as f:
+        for line in f:
+            run = json.loads(line)
+            if run.get("params") == params:
+                last = run
+    return last
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time every stage of the collector tick on the bundled sample payloads")
+    parser.add_argument("--symbols", type=int, default=5, help="number of synthetic underlyings")
+    parser.add_argument("--strike-scale", type=int, default=1, help="multiply the strikes of OptionOI.json")
+    parser.add_argument("--days", type=int, default=5, help="trading days of 5 minute ticks")
+    parser.add_argument("--workers", type=int, nargs="*", default=[1, os.cpu_count() or 1],
+                        help="process pool sizes to measure parse and analytics throughput with")
+    parser.add_argument("--output", default="bench_results.jsonl", help="file runs are appended to")
+    args = parser.parse_args()
+
+    params = {"symbols": args.symbols, "strikeScale": args.strike_scale, "days": args.days, "workers": args.workers}
+    results = runBenchmarks(args.symbols, args.strike_scale, args.days, args.workers)
+    previous = previousRun(args.output, params)
+    before = {r["stage"]: r for r in previous["results"]} if previous else {}
+
+    print("{:<18}{:>8}{:>10}{:>10}{:>10}{:>12}{:>10}{:>10}".format("stage", "calls", "mean ms", "p50 ms", "p95 ms", "per sec", "peak KiB", "vs last"))
+    for r in results:
+        old = before.get(r["stage"])
+        change = "{:+.0%}".format(r["meanMs"] / old["meanMs"] - 1) if old and old["meanMs"] else ""
+        columns = (r["stage"], r["calls"], r["meanMs"], r["p50Ms"], r["p95Ms"], r["perSec"], r["peakKiB"], change)
+        print("{:<18}{:>8}{:>10}{:>10}{:>10}{:>12}{:>10}{:>10}".format(*("-" if c is None else c for c in columns)))
+        if "excelCallsPerTick" in r:
+            print("{:<18}{} Excel round-trips per tick".format("", r["excelCallsPerTick"]))
+
+    run = {"time": datetime.now().isoformat(timespec="seconds"), "version": gitVersion(),
+           "python": platform.python_version(), "params": params, "results": results}
+    with open(args.output, "a") as f:
+        f.write(json.dumps(run) + "\n")
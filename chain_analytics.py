@@ -0,0 +1,127 @@
+import numpy as np
+from chain_parser import parseOptionChain
+from greeks import chainGreeks
+
+TOP_N = 3
+SKEW_WIDTH = 0.05
+
+# Per expiry columns returned by analyseChain; the top* columns are (expiries, topN) strike arrays
+ANALYTICS_COLUMNS = ("expiry", "ceOI", "peOI", "ceVol", "peVol", "pcrOI", "pcrVol", "maxPain",
+                     "topCeOI", "topPeOI", "topCeChgOI", "topPeChgOI",
+                     "atmStrike", "atmIV", "otmPutIV", "otmCallIV", "ivSkew", "gex")
+
+
+# Function to get cumulative sums of x restarting at every group start (x sorted by group)
+def groupCumsum(x, starts, counts):
+    total = np.cumsum(x)
+    return total - np.repeat(total[starts] - x[starts], counts)
+
+
+# Function to get the position of the smallest value of every group, ties go to the first row
+def groupArgmin(values, group, starts):
+    return np.lexsort((values, group))[starts]
+
+
+# Function to get the strikes of the n largest positive values of every group, NaN where there are fewer
+def groupTop(values, strike, group, starts, counts, n):
+    order = np.lexsort((-values, group))
+    top = np.full((len(starts), n), np.nan)
+    for rank in range(n):
+        has = rank < counts
+        rows = order[starts[has] + rank]
+        top[has, rank] = np.where(values[rows] > 0, strike[rows], np.nan)
+    return top
+
+
+def ratio(num, den):
+    num = np.asarray(num, dtype=np.float64)
+    den = np.asarray(den, dtype=np.float64)
+    return np.divide(num, den, out=np.full(len(num), np.nan), where=den != 0)
+
+
+# Function to compute option chain metrics of every expiry of chain in one vectorized pass:
+# put/call ratios by OI and volume, max pain, the topN CE/PE OI and change in OI strikes
+# (resistance/support walls), and the IV skew between the put `skewWidth` below and the call
+# `skewWidth` above the underlying, and the OI weighted gamma exposure: the change in option writers'
+# delta per 1% move of the underlying, calls positive and puts negative, in contracts times underlying
+# units (uses the Greeks set on chain by greeks.chainGreeks, legs without Greeks count as 0).
+# Rows are ordered by expiry date.
+def analyseChain(chain, topN=TOP_N, skewWidth=SKEW_WIDTH):
+    if len(chain) == 0:
+        return {name: np.empty((0, topN) if name.startswith("top") else 0) for name in ANALYTICS_COLUMNS}
+    # Rows of the table are already sorted by expiry and strike, so expiries are contiguous groups
+    group = chain.ordinals
+    starts = chain.expiryStarts[:-1]
+    counts = np.diff(chain.expiryStarts)
+    strike = chain.strike
+    ceOI = chain.ceOI.astype(np.float64)
+    peOI = chain.peOI.astype(np.float64)
+
+    sums = {name: np.add.reduceat(getattr(chain, name), starts) for name in ("ceOI", "peOI", "ceVol", "peVol")}
+
+    # Max pain: total payout of option writers if the expiry settles at each strike of its chain.
+    # Calls below the settle strike pay K*sum(ceOI) - sum(ceOI*strike), puts above it the mirror image.
+    callPain = strike * groupCumsum(ceOI, starts, counts) - groupCumsum(ceOI * strike, starts, counts)
+    putOIAbove = np.repeat(np.add.reduceat(peOI, starts), counts) - groupCumsum(peOI, starts, counts) + peOI
+    putValueAbove = np.repeat(np.add.reduceat(peOI * strike, starts), counts) - groupCumsum(peOI * strike, starts, counts) + peOI * strike
+    maxPain = strike[groupArgmin(callPain + putValueAbove - strike * putOIAbove, group, starts)]
+
+    spot = chain.underlyingValue or np.nan
+    gamma = np.nan_to_num(chain.ceGamma) * ceOI - np.nan_to_num(chain.peGamma) * peOI
+    gex = np.add.reduceat(gamma, starts) * spot * spot * 0.01
+
+    # IV skew, strikes with no IV reported are never picked
+    ceIV = chain.ceIV
+    peIV = chain.peIV
+    atm = chain.atmRows()
+    atmIVs = np.stack([ceIV[atm], peIV[atm]])
+    atmIV = np.divide(atmIVs.sum(axis=0), (atmIVs > 0).sum(axis=0), out=np.full(len(starts), np.nan),
+                      where=(atmIVs > 0).any(axis=0))
+    put = groupArgmin(np.where(peIV > 0, np.abs(strike - spot * (1 - skewWidth)), np.inf), group, starts)
+    call = groupArgmin(np.where(ceIV > 0, np.abs(strike - spot * (1 + skewWidth)), np.inf), group, starts)
+    otmPutIV = np.where(peIV[put] > 0, peIV[put], np.nan)
+    otmCallIV = np.where(ceIV[call] > 0, ceIV[call], np.nan)
+
+    return {
+        "expiry": chain.expiryNames,
+        "ceOI": sums["ceOI"],
+        "peOI": sums["peOI"],
+        "ceVol": sums["ceVol"],
+        "peVol": sums["peVol"],
+        "pcrOI": ratio(sums["peOI"], sums["ceOI"]),
+        "pcrVol": ratio(sums["peVol"], sums["ceVol"]),
+        "maxPain": maxPain,
+        "topCeOI": groupTop(ceOI, strike, group, starts, counts, topN),
+        "topPeOI": groupTop(peOI, strike, group, starts, counts, topN),
+        "topCeChgOI": groupTop(chain.ceChgOI, strike, group, starts, counts, topN),
+        "topPeChgOI": groupTop(chain.peChgOI, strike, group, starts, counts, topN),
+        "atmStrike": strike[atm],
+        "atmIV": atmIV,
+        "otmPutIV": otmPutIV,
+        "otmCallIV": otmCallIV,
+        "ivSkew": otmPutIV - otmCallIV,
+        "gex": gex,
+    }
+
+
+# Function to attach Greeks to the `strikeWindow` strikes either side of ATM of every expiry (every strike
+# without a window) and compute the per expiry analytics. Returns the windowed table, which is all later
+# stages see, and the analytics: OI sums, PCR, max pain and walls still cover the whole chain, gamma
+# exposure only the window (at 20 strikes that is all of it for the nearest expiry, far expiries differ more).
+def analyseWindow(chain, strikeWindow=None):
+    if not strikeWindow:
+        chain.setGreeks(chainGreeks(chain))
+        return chain, analyseChain(chain)
+    rows = chain.windowRows(strikeWindow)
+    near = chain.select(rows)
+    greeks = chainGreeks(near)
+    near.setGreeks(greeks)
+    chain.setGreeks(greeks, rows)
+    return near, analyseChain(chain)
+
+
+# Function to do all per tick CPU work that needs no collector state: parse the raw option chain,
+# attach Greeks and compute the per expiry analytics. Module level so it can run in a process pool;
+# only the window and the per strike levels of the whole chain go back to the collector.
+def parseAndAnalyse(raw, strikeWindow=None):
+    return analyseWindow(parseOptionChain(raw), strikeWindow)
@@ -0,0 +1,196 @@
+import copy
+import json
+from operator import itemgetter
+import numpy as np
+from state_store import STRIKE_FIELDS, expiryOrdinals, strikeKeys
+
+LEG_FIELDS = ("openInterest", "changeinOpenInterest", "lastPrice", "impliedVolatility", "totalTradedVolume")
+EMPTY_LEG = (0, 0, 0.0, 0.0, 0)
+# Strikes kept either side of the ATM strike of every expiry by default
+STRIKE_WINDOW = 20
+legGetter = itemgetter(*LEG_FIELDS)
+
+
+# Per-strike option chain as flat NumPy columns, one entry per (expiry, strike) of records.data.
+# `filtered` marks the nearest-expiry rows NSE also sends under filtered.data.
+# Rows are sorted by expiry date, then strike, so every expiry is one contiguous block of ascending strikes
+# (expiryNames/expiryStarts index the blocks, grouped by the per-row expiry ordinals). The ATM strike of an expiry is a binary search in its block
+# and a window of strikes around it is a plain slice: window() hands out views, no column is copied.
+class OptionChainTable:
+    def __init__(self, columns, expiryDates, underlyingValue, timestamp, filteredTotals, filteredExpiry):
+        self.expiry = np.array(columns["expiry"], dtype=str)
+        self.strike = np.array(columns["strike"], dtype=np.float64)
+        self.ceOI = np.array(columns["ceOI"], dtype=np.int64)
+        self.ceChgOI = np.array(columns["ceChgOI"], dtype=np.int64)
+        self.ceLTP = np.array(columns["ceLTP"], dtype=np.float64)
+        self.ceIV = np.array(columns["ceIV"], dtype=np.float64)
+        self.ceVol = np.array(columns["ceVol"], dtype=np.int64)
+        self.peOI = np.array(columns["peOI"], dtype=np.int64)
+        self.peChgOI = np.array(columns["peChgOI"], dtype=np.int64)
+        self.peLTP = np.array(columns["peLTP"], dtype=np.float64)
+        self.peIV = np.array(columns["peIV"], dtype=np.float64)
+        self.peVol = np.array(columns["peVol"], dtype=np.int64)
+        self.expiryDates = expiryDates
+        self.underlyingValue = underlyingValue
+        self.timestamp = timestamp
+        self.filteredTotals = filteredTotals
+        self.filteredExpiry = filteredExpiry
+        self.ordinals = expiryOrdinals(self.expiry)
+        self.keys = strikeKeys(self.expiry, self.strike, self.ordinals)
+        if np.any(self.keys[1:] < self.keys[:-1]):
+            order = np.argsort(self.keys, kind="stable")
+            self.keys = self.keys[order]
+            self.ordinals = self.ordinals[order]
+            for name in COLUMNS:
+                setattr(self, name, getattr(self, name)[order])
+        self.filtered = self.expiry == filteredExpiry
+        # A table cut out with select() keeps the per strike levels of the whole parsed chain and its rows
+        # in it, so changes between ticks are matched on every strike, not just the ones in the window
+        self.chainLevels = None
+        self.chainRows = None
+        self.indexExpiries()
+        self.setDeltas({})
+        self.setGreeks({})
+
+    def indexExpiries(self):
+        group = self.ordinals
+        starts = np.flatnonzero(np.concatenate([[True], group[1:] != group[:-1]])) if len(group) else np.empty(0, dtype=np.intp)
+        self.expiryNames = self.expiry[starts]
+        self.expiryStarts = np.append(starts, len(group))
+
+    # Function to attach per-strike changes since the previous tick (see state_store.StateStore.chainChanges)
+    def setDeltas(self, deltas):
+        for name in DELTA_COLUMNS:
+            values = deltas.get(name)
+            setattr(self, name, values if values is not None else np.zeros_like(getattr(self, name[:-len("Delta")])))
+
+    # Function to attach per-leg model IV and Greeks (see greeks.chainGreeks), NaN until computed.
+    # With rows the values are those of chain.select(rows) and every other row gets NaN.
+    def setGreeks(self, greeks, rows=None):
+        for name in GREEK_COLUMNS:
+            values = greeks.get(name)
+            if values is not None and rows is not None:
+                values, full = np.full(len(self.strike), np.nan), values
+                values[rows] = full
+            setattr(self, name, values if values is not None else np.full(len(self.strike), np.nan))
+
+    def __len__(self):
+        return len(self.strike)
+
+    # Function to get CE/PE OI and change in OI totals, over every row or only rows in `mask`
+    def totals(self, mask=None):
+        cols = (self.ceOI, self.peOI, self.ceChgOI, self.peChgOI, self.ceVol, self.peVol)
+        if mask is not None:
+            cols = [c[mask] for c in cols]
+        sums = np.array([c.sum() for c in cols])
+        return dict(zip(("ceOI", "peOI", "ceChgOI", "peChgOI", "ceVol", "peVol"), sums.tolist()))
+
+    # Function to get the rows of one expiry (the nearest one by default) as a slice, empty if it is not listed
+    def expirySlice(self, expiry=None):
+        found = np.flatnonzero(self.expiryNames == expiry) if expiry is not None else np.arange(min(len(self.expiryNames), 1))
+        if len(found) == 0:
+            return slice(0, 0)
+        return slice(int(self.expiryStarts[found[0]]), int(self.expiryStarts[found[0] + 1]))
+
+    # Function to get the row of the strike nearest underlyingValue in every expiry, one binary search
+    # on the sorted keys for all of them; ties go to the lower strike
+    def atmRows(self):
+        starts, stops = self.expiryStarts[:-1], self.expiryStarts[1:]
+        spot = float(self.underlyingValue or np.nan)
+        if len(starts) == 0 or spot != spot:
+            return starts
+        target = strikeKeys(None, spot, self.ordinals[starts])
+        above = np.minimum(np.searchsorted(self.keys, target), stops - 1)
+        below = np.maximum(above - 1, starts)
+        return np.where(spot - self.strike[below] <= self.strike[above] - spot, below, above)
+
+    # Function to get `strikes` strikes either side of the ATM strike of one expiry (the nearest by default) as a slice
+    def windowSlice(self, strikes, expiry=None):
+        rows = self.expirySlice(expiry)
+        if rows.stop == rows.start:
+            return rows
+        atm = int(self.atmRows()[np.searchsorted(self.expiryStarts, rows.start)])
+        return slice(max(rows.start, atm - strikes), min(rows.stop, atm + strikes + 1))
+
+    # Function to get the rows of the windows of every expiry as one ascending index array
+    def windowRows(self, strikes):
+        atm = self.atmRows()
+        first = np.maximum(self.expiryStarts[:-1], atm - strikes)
+        lengths = np.minimum(self.expiryStarts[1:], atm + strikes + 1) - first
+        offsets = np.cumsum(lengths) - lengths
+        return np.arange(lengths.sum()) - np.repeat(offsets - first, lengths)
+
+    # Function to get the keys and STRIKE_FIELDS of every strike of the parsed chain, with the rows of
+    # this table in them (None when this table is the whole chain)
+    def levels(self):
+        if self.chainLevels is not None:
+            return self.chainLevels, self.chainRows
+        return dict({name: getattr(self, name) for name in STRIKE_FIELDS}, keys=self.keys), None
+
+    # Function to get a table of some rows of this one. A slice gives views of every column, an index
+    # array copies just the selected rows.
+    def select(self, rows):
+        table = copy.copy(self)
+        for name in ROW_COLUMNS:
+            setattr(table, name, getattr(self, name)[rows])
+        table.chainLevels, chainRows = self.levels()
+        table.chainRows = (np.arange(len(self)) if chainRows is None else chainRows)[rows]
+        table.indexExpiries()
+        return table
+
+    # Function to get the table of `strikes` strikes either side of ATM of one expiry (the nearest by
+    # default) without copying, or of every expiry with allExpiries
+    def window(self, strikes, expiry=None, allExpiries=False):
+        return self.select(self.windowRows(strikes) if allExpiries else self.windowSlice(strikes, expiry))
+
+    # Function to get the columns as a dict of arrays, e.g. for pyarrow or pandas
+    def columns(self):
+        return {name: getattr(self, name) for name in COLUMNS + DELTA_COLUMNS + GREEK_COLUMNS}
+
+
+COLUMNS = ("expiry", "strike", "ceOI", "ceChgOI", "ceLTP", "ceIV", "ceVol",
+           "peOI", "peChgOI", "peLTP", "peIV", "peVol")
+DELTA_COLUMNS = ("ceOIDelta", "peOIDelta", "ceLTPDelta", "peLTPDelta")
+GREEK_COLUMNS = ("ceModelIV", "peModelIV", "ceDelta", "peDelta", "ceGamma", "peGamma",
+                 "ceVega", "peVega", "ceTheta", "peTheta")
+ROW_COLUMNS = COLUMNS + DELTA_COLUMNS + GREEK_COLUMNS + ("keys", "ordinals", "filtered")
+
+
+# Function to parse a raw option-chain-indices/equities payload straight into an OptionChainTable.
+# Legs and rows are collapsed into tuples while the decoder builds them, so the ~20 field dicts of
+# every contract never live together in memory. Rows of expiries not in `expiries` are dropped during the parse.
+def parseOptionChain(raw, expiries=None):
+    rows = []
+
+    def hook(obj):
+        if "identifier" in obj:
+            # CE or PE leg
+            if expiries is not None and obj.get("expiryDate") not in expiries:
+                return None
+            try:
+                return legGetter(obj)
+            except KeyError:
+                return tuple(obj.get(field, 0) for field in LEG_FIELDS)
+        if "strikePrice" in obj and "expiryDate" in obj:
+            # Row of records.data or filtered.data, replaced by its index in rows
+            expiry = obj["expiryDate"]
+            if expiries is not None and expiry not in expiries:
+                return None
+            rows.append((expiry, obj["strikePrice"]) + (obj.get("CE") or EMPTY_LEG) + (obj.get("PE") or EMPTY_LEG))
+            return len(rows) - 1
+        return obj
+
+    if isinstance(raw, (bytes, bytearray)):
+        raw = raw.decode("utf-8")
+    top = json.loads(raw, object_hook=hook)
+    records = top["records"]
+    filtered = top.get("filtered", {})
+
+    # filtered.data repeats the nearest expiry rows of records.data; keep records only
+    kept = [rows[i] for i in records["data"] if i is not None]
+    filteredRows = [i for i in filtered.get("data", []) if i is not None]
+    filteredExpiry = rows[filteredRows[0]][0] if filteredRows else None
+    columns = dict(zip(COLUMNS, zip(*kept))) if kept else {name: () for name in COLUMNS}
+    filteredTotals = {leg: filtered[leg] for leg in ("CE", "PE") if leg in filtered}
+    return OptionChainTable(columns, records.get("expiryDates", []), records.get("underlyingValue"),
+                            records.get("timestamp"), filteredTotals, filteredExpiry)
@@ -0,0 +1,192 @@
+import os
+import threading
+from datetime import datetime, date
+import numpy as np
+import pandas as pd
+from chain_analytics import analyseChain
+from chain_parser import STRIKE_WINDOW, parseOptionChain
+from excel_export import ExcelExport, changeFills, signalFills
+from greeks import chainGreeks
+from resample import BarBuilder
+from ring_buffer import RingBuffer
+from scheduler import futuresExpiryText, inSession, monthlyExpiry, nextBoundary
+from signals import analyse
+
+# Columns of the 5 and 15 minute logs as kept in the ring buffers
+LOG_FIELDS = [("Timestamp", "M8[s]"), ("LTP", np.float64), ("Fut LTP", np.float64), ("Fut OI", np.int64),
+              ("CE OI", np.int64), ("PE OI", np.int64), ("CE OI Change", np.int64), ("PE OI Change", np.int64)]
+SESSION_MINUTES = 375
+EXPORT_COLUMNS = ["Timestamp", "LTP", "CE OI", "PE OI", "CE OI Change", "PE OI Change", "Sentiment", "Signal"]
+
+# Function to fetch NIFTY LTP
+def fetch_nifty_ltp(client):
+    data = client.fetchMarketStatus()
+    for index in data["marketState"]:
+        if index["index"] == "NIFTY 50":
+            return float(index["last"])
+    return None
+
+# Function to fetch option chain data as a columnar per-strike table, with Greeks of the strike_window
+# strikes either side of ATM of every expiry
+def fetch_option_chain(client, strike_window=STRIKE_WINDOW):
+    chain = parseOptionChain(client.fetchOptionChainRaw("NIFTY"))
+    rows = chain.windowRows(strike_window)
+    chain.setGreeks(chainGreeks(chain.select(rows)), rows)
+    return chain
+
+# Function to fetch NIFTY futures LTP and OI of the current month
+def fetch_nifty_futures(client, expiry_dates):
+    expiry = futuresExpiryText(monthlyExpiry(date.today(), expiry_dates))
+    data = client.fetchFutures("NIFTY", expiry)["data"][0]
+    return float(data["lastPrice"].replace(',', '')), int(data["openInterest"].replace(',', ''))
+
+# Function to add sentiment and signal to a log (dict of column arrays), using the same rules as the Excel collector
+def log_frame(log):
+    df = pd.DataFrame(log, copy=False)
+    if df.empty:
+        return df
+    result = analyse(df["Fut LTP"], df["Fut OI"], df["CE OI"], df["PE OI"])
+    df["Sentiment"] = pd.Series(result["interpretation"]).replace("", "Neutral").to_numpy()
+    df["Signal"] = pd.Series(result["signal"]).replace("", "Hold").to_numpy()
+    return df
+
+# Function to build the option chain table shown on the dashboard, usually of a chain.window()
+def option_chain_frame(chain):
+    return pd.DataFrame({
+        "Strike Price": chain.strike,
+        "CE OI": chain.ceOI,
+        "CE Change OI": chain.ceChgOI,
+        "CE LTP": chain.ceLTP,
+        "PE OI": chain.peOI,
+        "PE Change OI": chain.peChgOI,
+        "PE LTP": chain.peLTP,
+        "CE Delta": chain.ceDelta.round(3),
+        "PE Delta": chain.peDelta.round(3),
+        "CE IV": chain.ceModelIV.round(2),
+        "PE IV": chain.peModelIV.round(2)
+    })
+
+# Function to turn rows of top strikes into text like "12000, 11500"
+def wall_text(tops):
+    return [", ".join(str(int(s)) for s in row if s == s) for row in tops]
+
+# Function to build the per expiry PCR, max pain, OI walls, IV skew and gamma exposure table shown on the dashboard
+def analytics_frame(chain):
+    analytics = analyseChain(chain)
+    return pd.DataFrame({
+        "Expiry": analytics["expiry"],
+        "PCR (OI)": analytics["pcrOI"].round(2),
+        "PCR (Volume)": analytics["pcrVol"].round(2),
+        "Max Pain": analytics["maxPain"],
+        "CE OI Walls": wall_text(analytics["topCeOI"]),
+        "PE OI Walls": wall_text(analytics["topPeOI"]),
+        "CE OI Change Walls": wall_text(analytics["topCeChgOI"]),
+        "PE OI Change Walls": wall_text(analytics["topPeChgOI"]),
+        "ATM IV": analytics["atmIV"],
+        "IV Skew": analytics["ivSkew"].round(2),
+        "GEX": analytics["gex"].round(0)
+    })
+
+# Function to export the 5/15 minute log rows logged since the previous export to workbooks in folder,
+# one part per day, the latest part with the option chain table given. Returns the workbooks written.
+def export_logs(view, option_chain=None, folder="OIAnalysisDashboard"):
+    export = ExcelExport(folder)
+    tables = []
+    for sheet, df in (("FiveMin", view["five_min"]), ("FifteenMin", view["fifteen_min"])):
+        if not df.empty:
+            columns = [df[name].to_numpy() for name in EXPORT_COLUMNS]
+            fills = {4: changeFills(columns[4]), 5: changeFills(columns[5]), 7: signalFills(columns[7])}
+            tables.append((sheet, columns[0], EXPORT_COLUMNS, columns, fills))
+    if option_chain is not None:
+        df = option_chain
+        tables.append(("OptionChain", None, list(df.columns), [df[name].to_numpy() for name in df.columns], {}))
+    return export.writeDays(tables)
+
+
+# Shared data layer of the dashboard. A background thread fetches NSE once per interval (on clock
+# boundaries during market hours, plus once at start and on request) and keeps the latest option chain
+# and the 5/15 minute logs with ready-made DataFrames. Page renders only read view(), so any number of
+# viewers cost one upstream fetch per interval and never wait on the network. Greeks are computed for
+# strike_window strikes either side of ATM; pages show a window of the chain, which is a view of it.
+# The logs are ring buffers on disk under history_dir holding retention_days of rows, so memory stays flat
+# and a restarted server shows the earlier history right away.
+class MarketCache:
+    def __init__(self, client, interval_min=5, min_refresh_sec=60, history_dir="dashboard_history", retention_days=20,
+                 strike_window=STRIKE_WINDOW):
+        self.client = client
+        self.strike_window = strike_window
+        self.interval_min = interval_min
+        self.min_refresh_sec = min_refresh_sec
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        folder = os.path.join(history_dir, "every{}min".format(interval_min))
+        self.five_min_log = RingBuffer(os.path.join(folder, "five_min"), LOG_FIELDS,
+                                       retention_days * (SESSION_MINUTES // interval_min + 1))
+        self.fifteen_min_log = RingBuffer(os.path.join(folder, "fifteen_min"), LOG_FIELDS,
+                                          retention_days * (SESSION_MINUTES // 15 + 1))
+        self.fifteen_min_bars = BarBuilder(15, price="LTP")
+        self.expiry_dates = []
+        self.state = {"fetched_at": None, "error": None, "chain": None, "analytics": None,
+                      "five_min": log_frame(self.five_min_log.tail()),
+                      "fifteen_min": log_frame(self.fifteen_min_log.tail())}
+        self.thread = threading.Thread(target=self.run, name="dashboard-data", daemon=True)
+        self.thread.start()
+
+    # Function to get the latest data for a render; never touches the network
+    def view(self):
+        with self.lock:
+            return dict(self.state)
+
+    # Function to ask the background thread for a fetch, ignored if data is fresher than min_refresh_sec
+    def request_refresh(self):
+        self.wake.set()
+
+    def is_stale(self):
+        fetched_at = self.state["fetched_at"]
+        return fetched_at is None or (datetime.now() - fetched_at).total_seconds() >= self.min_refresh_sec
+
+    def run(self):
+        self.fetch()
+        while True:
+            boundary = nextBoundary(datetime.now(), self.interval_min)
+            requested = self.wake.wait(max((boundary - datetime.now()).total_seconds(), 0))
+            self.wake.clear()
+            if requested and self.is_stale():
+                self.fetch()
+            elif not requested and inSession(boundary):
+                self.fetch(boundary)
+
+    # Function to fetch and log one tick. Scheduled fetches pass their boundary, which timestamps the
+    # log row, so the fetch latency never pushes a row into the next 15 minute bar.
+    def fetch(self, moment=None):
+        try:
+            ltp, chain, (fut_ltp, fut_oi) = self.client.fetchMany(
+                (fetch_nifty_ltp, self.client), (fetch_option_chain, self.client, self.strike_window),
+                (fetch_nifty_futures, self.client, self.expiry_dates))
+        except Exception as e:
+            with self.lock:
+                self.state["error"] = str(e)
+            return
+        self.expiry_dates = chain.expiryDates
+        totals = chain.totals()
+        now = datetime.now()
+        moment = moment or now.replace(microsecond=0)
+        log_entry = {
+            "Timestamp": np.datetime64(moment, "s"),
+            "LTP": ltp,
+            "Fut LTP": fut_ltp,
+            "Fut OI": fut_oi,
+            "CE OI": totals["ceOI"],
+            "PE OI": totals["peOI"],
+            "CE OI Change": totals["ceChgOI"],
+            "PE OI Change": totals["peChgOI"]
+        }
+        self.five_min_log.append(log_entry)
+        # 15-minute log gets one row per closed clock-aligned 15 minute bar
+        for bar in self.fifteen_min_bars.update(moment, log_entry):
+            self.fifteen_min_log.append(bar)
+        state = {"fetched_at": now, "error": None, "chain": chain,
+                 "analytics": analytics_frame(chain),
+                 "five_min": log_frame(self.five_min_log.tail()), "fifteen_min": log_frame(self.fifteen_min_log.tail())}
+        with self.lock:
+            self.state = state
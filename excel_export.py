@@ -0,0 +1,272 @@
+import argparse
+import json
+import os
+import zipfile
+from datetime import datetime
+from xml.sax.saxutils import escape, quoteattr
+import numpy as np
+from signals import BUY, SELL, analyse
+from sinks import FUTURES, OPTIONS, historyFiles, partPath, readHistory
+
+# Exports go to a folder of workbooks, one part per export and day:
+#   2020-09-14.xlsx     rows of the first export that covered the day
+#   2020-09-14.1.xlsx   rows added to that day after it, and so on
+# export.json keeps the time of the last exported row of every sheet, so an export writes only rows
+# newer than that and never opens a workbook written before.
+MANIFEST = "export.json"
+CHUNK_ROWS = 20000
+EXCEL_EPOCH = np.datetime64("1899-12-30T00:00:00", "s")
+
+FUTURES_HEADER = ["Time", "LTP", "Change in LTP", "Traded Volume(Contract)", "Future OI", "Change Future OI",
+                  "Call OI", "Change Call OI", "Put OI", "Change Put OI", "OI Interpretation", "Buy/Sell"]
+OPTIONS_HEADER = ["Time", "Expiry", "Strike Price", "CE LTP", "CE OI", "CE OI Change", "PE LTP", "PE OI",
+                  "PE OI Change"]
+
+# Cell styles of styles.xml: 1 header yellow, 2 green and 3 red like putInExcel5Min, 4 date and time.
+# Indexed by a fill sign, so -1 picks red.
+FILL_STYLES = np.array(["", ' s="2"', ' s="3"'], dtype=object)
+HEADER_STYLE = ' s="1"'
+DATE_STYLE = ' s="4"'
+
+MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PACKAGE_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+XML_HEAD = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+STYLES_XML = XML_HEAD + (
+    '<styleSheet xmlns="{}"><fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="5"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill>'
+    '<fill><patternFill patternType="solid"><fgColor rgb="FFFFFF00"/></patternFill></fill>'
+    '<fill><patternFill patternType="solid"><fgColor rgb="FF90EE90"/></patternFill></fill>'
+    '<fill><patternFill patternType="solid"><fgColor rgb="FFFFCCCB"/></patternFill></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="5"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="0" fillId="2" borderId="0" xfId="0" applyFill="1"/>'
+    '<xf numFmtId="0" fontId="0" fillId="3" borderId="0" xfId="0" applyFill="1"/>'
+    '<xf numFmtId="0" fontId="0" fillId="4" borderId="0" xfId="0" applyFill="1"/>'
+    '<xf numFmtId="22" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles></styleSheet>').format(MAIN_NS)
+
+
+# Function to get the fill of every row of a change column: 1 green, -1 red, 0 none
+def changeFills(values):
+    return np.sign(np.nan_to_num(np.asarray(values, dtype=float))).astype(np.int8)
+
+
+# Function to get green for Buy and red for Sell rows of a signal column
+def signalFills(values):
+    values = np.asarray(values)
+    return (values == BUY).astype(np.int8) - (values == SELL).astype(np.int8)
+
+
+# Function to get the <c> elements of one column. Dates become Excel serial numbers, NaN, None and
+# empty strings become empty cells, text is written inline so no shared string table is needed.
+def columnCells(values, signs=None):
+    values = np.asarray(values)
+    styles = FILL_STYLES[signs] if signs is not None else FILL_STYLES[np.zeros(len(values), dtype=np.int8)]
+    kind = values.dtype.kind
+    if kind == "M":
+        serials = ((values.astype("M8[s]") - EXCEL_EPOCH) / np.timedelta64(1, "D")).tolist()
+        return ["<c{}><v>{!r}</v></c>".format(DATE_STYLE, x) if x == x else "<c/>" for x in serials]
+    if kind == "f":
+        return ["<c{}><v>{!r}</v></c>".format(s, x) if x == x else "<c/>" for s, x in zip(styles, values.tolist())]
+    if kind in "iub":
+        return ["<c{}><v>{}</v></c>".format(s, int(x)) for s, x in zip(styles, values.tolist())]
+    return ['<c{} t="inlineStr"><is><t>{}</t></is></c>'.format(s, escape(str(x))) if x is not None and x != "" else "<c/>"
+            for s, x in zip(styles, values.tolist())]
+
+
+# Streams sheets straight into the zip of an .xlsx workbook, CHUNK_ROWS rows at a time, so memory
+# holds one chunk of cell text whatever the table size. The workbook only becomes visible at path
+# once close() wrote its index. Writes the same SpreadsheetML a write-only openpyxl workbook would,
+# without building a cell object per value.
+class StreamingWorkbook:
+    def __init__(self, path):
+        self.path = path
+        self.tmp = path + ".tmp"
+        self.zip = zipfile.ZipFile(self.tmp, "w", zipfile.ZIP_DEFLATED, compresslevel=1)
+        self.sheets = []
+
+    # Function to write one sheet: a yellow header row, then columns with fills mapping a column index
+    # to its changeFills/signalFills
+    def writeSheet(self, name, header, columns, fills):
+        self.sheets.append(name)
+        rows = len(columns[0]) if columns else 0
+        with self.zip.open("xl/worksheets/sheet{}.xml".format(len(self.sheets)), "w") as f:
+            f.write((XML_HEAD + '<worksheet xmlns="{}"><sheetData><row>'.format(MAIN_NS)).encode())
+            f.write("".join('<c{} t="inlineStr"><is><t>{}</t></is></c>'.format(HEADER_STYLE, escape(str(h)))
+                            for h in header).encode())
+            f.write(b"</row>")
+            for first in range(0, rows, CHUNK_ROWS):
+                chunk = slice(first, first + CHUNK_ROWS)
+                cells = [columnCells(column[chunk], fills[j][chunk] if j in fills else None)
+                         for j, column in enumerate(columns)]
+                f.write("".join("<row>" + "".join(row) + "</row>" for row in zip(*cells)).encode())
+            f.write(b"</sheetData></worksheet>")
+
+    def close(self):
+        sheets = range(1, len(self.sheets) + 1)
+        self.zip.writestr("[Content_Types].xml", XML_HEAD + (
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+            + "".join('<Override PartName="/xl/worksheets/sheet{}.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'.format(i)
+                      for i in sheets) + '</Types>'))
+        self.zip.writestr("_rels/.rels", XML_HEAD + (
+            '<Relationships xmlns="{}"><Relationship Id="rId1" Type="{}/officeDocument" Target="xl/workbook.xml"/>'
+            '</Relationships>').format(PACKAGE_REL_NS, REL_NS))
+        self.zip.writestr("xl/workbook.xml", XML_HEAD + '<workbook xmlns="{}" xmlns:r="{}"><sheets>{}</sheets></workbook>'.format(
+            MAIN_NS, REL_NS, "".join('<sheet name={} sheetId="{}" r:id="rId{}"/>'.format(quoteattr(name[:31]), i, i)
+                                     for i, name in zip(sheets, self.sheets))))
+        self.zip.writestr("xl/_rels/workbook.xml.rels", XML_HEAD + '<Relationships xmlns="{}">{}{}</Relationships>'.format(
+            PACKAGE_REL_NS,
+            "".join('<Relationship Id="rId{}" Type="{}/worksheet" Target="worksheets/sheet{}.xml"/>'.format(i, REL_NS, i) for i in sheets),
+            '<Relationship Id="rId{}" Type="{}/styles" Target="styles.xml"/>'.format(len(self.sheets) + 1, REL_NS)))
+        self.zip.writestr("xl/styles.xml", STYLES_XML)
+        self.zip.close()
+        os.replace(self.tmp, self.path)
+
+
+# Appends tables to the part workbooks of one folder, remembering per sheet what was exported
+class ExcelExport:
+    def __init__(self, folder):
+        self.folder = folder
+        self.marks = {}
+        path = os.path.join(folder, MANIFEST)
+        if os.path.exists(path):
+            with open(path) as f:
+                self.marks = {sheet: np.datetime64(mark, "s") for sheet, mark in json.load(f).items()}
+
+    # Function to get the day the next export starts reading at, None if nothing was exported yet
+    def firstDay(self):
+        if not self.marks:
+            return None
+        return min(self.marks.values()).astype(datetime).date()
+
+    # Function to get the rows of a sheet added since the last export as a boolean mask
+    def newRows(self, sheet, times):
+        times = np.asarray(times).astype("M8[s]")
+        mark = self.marks.get(sheet)
+        return np.ones(len(times), dtype=bool) if mark is None else times > mark
+
+    # Function to write the new rows of one day as the next part workbook of that day.
+    # tables are (sheet, times, header, columns, fills) with fills mapping a column index to its
+    # changeFills/signalFills; a table whose times is None is a snapshot written whole with every part.
+    # Returns the path written, None when no sheet had new rows.
+    def write(self, day, tables):
+        selected = []
+        for sheet, times, header, columns, fills in tables:
+            if times is None:
+                selected.append((sheet, None, header, columns, fills))
+                continue
+            rows = self.newRows(sheet, times)
+            if rows.any():
+                selected.append((sheet, np.asarray(times).astype("M8[s]")[rows], header, [np.asarray(c)[rows] for c in columns],
+                                 {j: signs[rows] for j, signs in fills.items()}))
+        if all(times is None for _, times, _, _, _ in selected):
+            return None
+        os.makedirs(self.folder, exist_ok=True)
+        path = partPath(os.path.join(self.folder, day.strftime("%Y-%m-%d")), ".xlsx")
+        wb = StreamingWorkbook(path)
+        for sheet, times, header, columns, fills in selected:
+            wb.writeSheet(sheet, header, columns, fills)
+        wb.close()
+        # Marks move only once the workbook is on disk, an interrupted export writes the rows again
+        for sheet, times, _, _, _ in selected:
+            if times is not None:
+                self.marks[sheet] = times.max()
+        self.save()
+        return path
+
+    # Function to write new rows that may span several days, one part workbook per day, in day order
+    def writeDays(self, tables):
+        days = set()
+        for sheet, times, header, columns, fills in tables:
+            if times is not None:
+                times = np.asarray(times).astype("M8[s]")
+                days.update(times[self.newRows(sheet, times)].astype("M8[D]").tolist())
+        days = sorted(days)
+        written = []
+        for day in days:
+            start = np.datetime64(day, "s")
+            end = start + np.timedelta64(1, "D")
+            dayTables = []
+            for sheet, times, header, columns, fills in tables:
+                if times is None:
+                    # Snapshots belong with the latest rows only
+                    if day == days[-1]:
+                        dayTables.append((sheet, times, header, columns, fills))
+                    continue
+                times = np.asarray(times).astype("M8[s]")
+                rows = (times >= start) & (times < end)
+                dayTables.append((sheet, times[rows], header, [np.asarray(c)[rows] for c in columns],
+                                  {j: signs[rows] for j, signs in fills.items()}))
+            path = self.write(day, dayTables)
+            if path:
+                written.append(path)
+        return written
+
+    def save(self):
+        path = os.path.join(self.folder, MANIFEST)
+        with open(path + ".tmp", "w") as f:
+            json.dump({sheet: str(mark) for sheet, mark in self.marks.items()}, f)
+        os.replace(path + ".tmp", path)
+
+
+# Function to get the futures sheet of one day in the layout of the 5 min sheet, changes and
+# colours computed over the whole day in one pass
+def futuresTable(df):
+    result = analyse(df["lastTraded"].to_numpy(), df["futOI"].to_numpy(), df["callOI"].to_numpy(), df["putOI"].to_numpy())
+    columns = [df["timestamp"].to_numpy(), df["lastTraded"].to_numpy(), result["changeInLTP"], df["tradedVolCon"].to_numpy(),
+               df["futOI"].to_numpy(), result["changeInFutOI"], df["callOI"].to_numpy(), result["changeInCallOI"],
+               df["putOI"].to_numpy(), result["changeInPutOI"], result["interpretation"], result["signal"]]
+    fills = {2: changeFills(result["changeInLTP"]), 5: changeFills(result["changeInFutOI"]),
+             7: changeFills(result["changeInCallOI"]), 9: changeFills(result["changeInPutOI"]),
+             11: signalFills(result["signal"])}
+    return ("Futures", columns[0], FUTURES_HEADER, columns, fills)
+
+
+# Function to get the per strike option chain sheet of one day in the layout of the Master sheet,
+# optionally limited to some expiries
+def optionsTable(df, expiries=None):
+    if expiries:
+        df = df[np.isin(df["expiry"].to_numpy(), list(expiries))]
+    columns = [df[name].to_numpy() for name in ("timestamp", "expiry", "strike", "ceLTP", "ceOI", "ceOIDelta",
+                                                "peLTP", "peOI", "peOIDelta")]
+    fills = {5: changeFills(columns[5]), 8: changeFills(columns[8])}
+    return ("OptionChain", columns[0], OPTIONS_HEADER, columns, fills)
+
+
+# Function to export stored Parquet history of one underlying to <folder>/<SYMBOL>/, adding only the
+# rows stored since the previous export. Days are read and written one at a time, so memory holds a
+# single day whatever the range. Returns the workbooks written.
+def exportHistory(root, symbol, folder, start=None, end=None, expiries=None):
+    export = ExcelExport(os.path.join(folder, symbol))
+    first = export.firstDay()
+    if first is not None and (start is None or start < first):
+        start = first
+    days = sorted({day for kind in (FUTURES, OPTIONS) for day, _, _ in historyFiles(root, kind, symbol, start, end)})
+    written = []
+    for day in days:
+        path = export.write(day, [futuresTable(readHistory(root, FUTURES, symbol, day, day)),
+                                  optionsTable(readHistory(root, OPTIONS, symbol, day, day), expiries)])
+        if path:
+            written.append(path)
+    return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export stored OI history to Excel, only rows added since the last export")
+    parser.add_argument("root", help="data folder of the Parquet sink (OiAnalysis.py --data-dir)")
+    parser.add_argument("--symbol", default="NIFTY")
+    parser.add_argument("--output", default="excel_export", help="folder the workbooks are written to")
+    parser.add_argument("--start", help="first day YYYY-MM-DD")
+    parser.add_argument("--end", help="last day YYYY-MM-DD")
+    parser.add_argument("--expiry", action="append", help="only export option chain rows of this expiry (repeatable)")
+    args = parser.parse_args()
+
+    parseDay = lambda text: datetime.strptime(text, "%Y-%m-%d").date() if text else None
+    for path in exportHistory(args.root, args.symbol, args.output, parseDay(args.start), parseDay(args.end), args.expiry):
+        print("Wrote", path)
@@ -0,0 +1,124 @@
+from datetime import datetime
+import numpy as np
+from scheduler import MARKET_CLOSE, parseExpiry
+
+RISK_FREE_RATE = 0.07
+YEAR_SECONDS = 365 * 24 * 3600
+MIN_YEARS = 60 / YEAR_SECONDS
+MIN_VOL = 1e-4
+MAX_VOL = 5.0
+SQRT_2PI = np.sqrt(2 * np.pi)
+
+
+# Function to get erf of an array (Abramowitz and Stegun 7.1.26, error below 1.5e-7), keeps scipy out
+def erf(x):
+    sign = np.sign(x)
+    x = np.abs(x)
+    t = 1 / (1 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    return sign * (1 - poly * np.exp(-x * x))
+
+
+def normCdf(x):
+    return 0.5 * (1 + erf(x / np.sqrt(2)))
+
+
+def normPdf(x):
+    return np.exp(-0.5 * x * x) / SQRT_2PI
+
+
+# Function to get years left till 3:30 PM of every expiry name in `expiry` as seen at `now`
+def yearsToExpiry(expiry, now):
+    if len(expiry) == 0:
+        return np.empty(0)
+    names, inverse = np.unique(expiry, return_inverse=True)
+    close = [datetime.combine(parseExpiry(str(name)), MARKET_CLOSE) for name in names]
+    years = np.array([(end - now).total_seconds() / YEAR_SECONDS for end in close])
+    return np.maximum(years[inverse], MIN_YEARS)
+
+
+# Function to get Black-Scholes prices of European options, isCall picks call or put per element
+def blackScholes(spot, strike, years, vol, isCall, rate=RISK_FREE_RATE):
+    sqrtT = np.sqrt(years)
+    d1 = (np.log(spot / strike) + (rate + 0.5 * vol * vol) * years) / (vol * sqrtT)
+    d2 = d1 - vol * sqrtT
+    discount = strike * np.exp(-rate * years)
+    call = spot * normCdf(d1) - discount * normCdf(d2)
+    return np.where(isCall, call, call - spot + discount)
+
+
+# Function to solve the volatility that reproduces `price` for every element at once. Newton steps on
+# vega, falling back to bisection whenever a step leaves the bracket, so far OTM contracts with tiny vega
+# still converge. Prices outside the no-arbitrage bounds give NaN.
+def impliedVol(price, spot, strike, years, isCall, rate=RISK_FREE_RATE, tolerance=1e-6, iterations=50):
+    price, strike, years, isCall = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (price, strike, years, isCall)))
+    isCall = isCall.astype(bool)
+    discount = strike * np.exp(-rate * years)
+    lower = np.where(isCall, np.maximum(spot - discount, 0), np.maximum(discount - spot, 0))
+    upper = np.where(isCall, spot, discount)
+    valid = (price > lower) & (price < upper)
+    low = np.full(price.shape, MIN_VOL)
+    high = np.full(price.shape, MAX_VOL)
+    vol = np.full(price.shape, 0.3)
+    active = valid.copy()
+    for _ in range(iterations):
+        if not active.any():
+            break
+        p, k, t, c, v = price[active], strike[active], years[active], isCall[active], vol[active]
+        diff = blackScholes(spot, k, t, v, c, rate) - p
+        sqrtT = np.sqrt(t)
+        d1 = (np.log(spot / k) + (rate + 0.5 * v * v) * t) / (v * sqrtT)
+        vega = spot * normPdf(d1) * sqrtT
+        lo = np.where(diff < 0, v, low[active])
+        hi = np.where(diff > 0, v, high[active])
+        step = v - diff / np.where(vega > 0, vega, np.nan)
+        step = np.where((step > lo) & (step < hi), step, 0.5 * (lo + hi))
+        done = (np.abs(diff) < tolerance * np.maximum(p, 1)) | (hi - lo < tolerance)
+        low[active], high[active], vol[active] = lo, hi, np.where(done, v, step)
+        active[np.flatnonzero(active)[done]] = False
+    return np.where(valid, vol, np.nan)
+
+
+# Function to get delta, gamma, vega (per 1 vol point) and theta (per calendar day) of every element
+def bsGreeks(spot, strike, years, vol, isCall, rate=RISK_FREE_RATE):
+    sqrtT = np.sqrt(years)
+    d1 = (np.log(spot / strike) + (rate + 0.5 * vol * vol) * years) / (vol * sqrtT)
+    d2 = d1 - vol * sqrtT
+    pdf = normPdf(d1)
+    discount = strike * np.exp(-rate * years)
+    callTheta = -spot * pdf * vol / (2 * sqrtT) - rate * discount * normCdf(d2)
+    return {
+        "delta": np.where(isCall, normCdf(d1), normCdf(d1) - 1),
+        "gamma": pdf / (spot * vol * sqrtT),
+        "vega": spot * pdf * sqrtT / 100,
+        "theta": np.where(isCall, callTheta, callTheta + rate * discount) / 365,
+    }
+
+
+# Function to compute Greeks of every CE and PE leg of chain in one vectorized pass. The volatility is
+# NSE's impliedVolatility where reported, otherwise solved from the leg's last price. Time to expiry is
+# measured from the chain's own timestamp so replayed ticks give the same numbers as live ones.
+# Returns GREEK_COLUMNS of chain_parser (IV in percent like NSE, NaN where nothing could be priced).
+def chainGreeks(chain, now=None, rate=RISK_FREE_RATE):
+    if now is None:
+        try:
+            now = datetime.strptime(chain.timestamp, "%d-%b-%Y %H:%M:%S")
+        except (TypeError, ValueError):
+            now = datetime.now()
+    n = len(chain)
+    spot = float(chain.underlyingValue or np.nan)
+    strike = np.concatenate([chain.strike, chain.strike])
+    years = np.tile(yearsToExpiry(chain.expiry, now), 2)
+    isCall = np.arange(2 * n) < n
+    price = np.concatenate([chain.ceLTP, chain.peLTP])
+    vol = np.concatenate([chain.ceIV, chain.peIV]) / 100
+    missing = (vol <= 0) & (price > 0)
+    vol = np.where(vol > 0, vol, np.nan)
+    if missing.any():
+        vol[missing] = impliedVol(price[missing], spot, strike[missing], years[missing], isCall[missing], rate)
+    greeks = bsGreeks(spot, strike, years, vol, isCall, rate)
+    result = {"ceModelIV": 100 * vol[:n], "peModelIV": 100 * vol[n:]}
+    for name, values in greeks.items():
+        result["ce" + name.capitalize()] = values[:n]
+        result["pe" + name.capitalize()] = values[n:]
+    return result
@@ -0,0 +1,187 @@
+import os
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def labelText(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs) + "}"
+
+
+def numberText(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(tuple(str(labels.get(name, "")) for name in self.labels), 0)
+
+    def render(self):
+        lines = ["# HELP {} {}".format(self.name, self.help), "# TYPE {} counter".format(self.name)]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append("{}{} {}".format(self.name, labelText(self.labels, key), numberText(value)))
+        return lines
+
+
+# Cumulative histogram with fixed bucket bounds in seconds, rendered like prometheus_client does
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key] = (counts, total + value)
+
+    # Function to time the body of a with block into this histogram
+    @contextmanager
+    def time(self, **labels):
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - started, **labels)
+
+    def render(self):
+        lines = ["# HELP {} {}".format(self.name, self.help), "# TYPE {} histogram".format(self.name)]
+        with self.lock:
+            for key, (counts, total) in sorted(self.values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    lines.append("{}_bucket{} {}".format(self.name, labelText(self.labels, key, [("le", numberText(bound))]), count))
+                lines.append("{}_sum{} {}".format(self.name, labelText(self.labels, key), repr(total)))
+                lines.append("{}_count{} {}".format(self.name, labelText(self.labels, key), counts[-1]))
+        return lines
+
+
+# Collection of metrics rendered together in the Prometheus text exposition format
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help, labels=()):
+        metric = Counter(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    # Function to write the metrics to path atomically, e.g. for node_exporter's textfile collector
+    def writeFile(self, path):
+        tmp = "{}.{}.tmp".format(path, threading.get_ident())
+        with open(tmp, "w") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+    # Function to rewrite path every `seconds` on a daemon thread
+    def writeEvery(self, path, seconds=15):
+        stopped = threading.Event()
+
+        def loop():
+            while True:
+                self.writeFile(path)
+                if stopped.wait(seconds):
+                    self.writeFile(path)
+                    return
+
+        threading.Thread(target=loop, name="metrics-file", daemon=True).start()
+        return stopped
+
+    # Function to serve the metrics at http://host:port/metrics on a daemon thread
+    def serve(self, port, host="127.0.0.1"):
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return server
+
+
+# Function to name the cause of a failure for the failure counters: the HTTP status for NSE errors,
+# the exception class otherwise
+def failureCause(error):
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    if status is not None:
+        return "http_" + str(status)
+    return type(error).__name__
+
+
+# Function to time one stage of a symbol's tick and count its failure by cause if it raises
+@contextmanager
+def timeStage(symbol, stage):
+    started = perf_counter()
+    try:
+        yield
+    except Exception as e:
+        failures.inc(symbol=symbol, stage=stage, cause=failureCause(e))
+        raise
+    finally:
+        stageSeconds.observe(perf_counter() - started, symbol=symbol, stage=stage)
+
+
+registry = Registry()
+stageSeconds = registry.histogram("oi_stage_seconds", "Time spent in each stage of a collector tick",
+                                  ("symbol", "stage"))
+fetchSeconds = registry.histogram("oi_fetch_seconds", "Latency of NSE requests including retries", ("endpoint",))
+writeSeconds = registry.histogram("oi_sink_write_seconds", "Latency of sink writes", ("sink", "kind"))
+ticks = registry.counter("oi_ticks_total", "Collector ticks completed", ("symbol",))
+failures = registry.counter("oi_failures_total", "Failed ticks by stage and cause", ("symbol", "stage", "cause"))
+retries = registry.counter("oi_retries_total", "NSE request retries by cause", ("endpoint", "cause"))
+droppedWrites = registry.counter("oi_dropped_writes_total", "Sink writes dropped because the sink queue was full",
+                                 ("sink", "kind"))
+missedSlots = registry.counter("oi_missed_slots_total", "Interval slots in market hours with no data collected",
+                               ("symbol", "cause"))
@@ -0,0 +1,146 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep
+from urllib.parse import quote
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import metrics
+
+HOME_URL = "https://www.nseindia.com"
+FUTURES_URL = "https://www1.nseindia.com/live_market/dynaContent/live_watch/get_quote/ajaxFOGetQuoteJSON.jsp?underlying={symbol}&instrument={instrument}&expiry={expiry}&type=-&strike=-"
+FUTURES_REFERER = "https://www1.nseindia.com/live_market/dynaContent/live_watch/get_quote/GetQuoteFO.jsp?underlying={symbol}&instrument={instrument}&expiry={expiry}"
+OPTION_CHAIN_URL = "https://www.nseindia.com/api/option-chain-indices?symbol={symbol}"
+OPTION_CHAIN_EQUITY_URL = "https://www.nseindia.com/api/option-chain-equities?symbol={symbol}"
+MARKET_STATUS_URL = "https://www.nseindia.com/api/marketStatus"
+
+INDICES = ("NIFTY", "BANKNIFTY", "FINNIFTY", "MIDCPNIFTY")
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/85.0.4183.102 Safari/537.36',
+    'Accept': '*/*',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Accept-Encoding': 'gzip, deflate',
+    'Referer': HOME_URL,
+}
+
+
+# Function to get the metrics label of a NSE url
+def endpointName(url):
+    if "option-chain" in url:
+        return "option_chain"
+    if "ajaxFOGetQuote" in url:
+        return "futures"
+    if "marketStatus" in url:
+        return "market_status"
+    return "home"
+
+
+# urllib3 retry policy that counts every retry it makes by endpoint and cause
+class CountingRetry(Retry):
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        if response is not None and response.status:
+            cause = "http_" + str(response.status)
+        else:
+            cause = type(error).__name__ if error is not None else "unknown"
+        metrics.retries.inc(endpoint=endpointName(url or ""), cause=cause)
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+
+# Long-lived NSE client: one pooled keep-alive session shared by every fetch,
+# cookies bootstrapped from the home page and refreshed when NSE rejects them.
+class NseClient:
+    def __init__(self, timeout=10, retries=3, backoff=0.5, workers=4):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        retry = CountingRetry(total=retries, backoff_factor=backoff, status_forcelist=(429, 500, 502, 503, 504),
+                              allowed_methods=("GET",))
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=workers * 2, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="nse")
+        self.lock = threading.Lock()
+        self.bootstrapped = False
+
+    def bootstrap(self):
+        with self.lock:
+            self.session.get(HOME_URL, timeout=self.timeout)
+            self.bootstrapped = True
+
+    # Function to GET a NSE url and return the raw body, re-bootstrapping cookies on 401/403
+    def getRaw(self, url, referer=None):
+        if not self.bootstrapped:
+            self.bootstrap()
+        headers = {'Referer': referer} if referer else None
+        endpoint = endpointName(url)
+        with metrics.fetchSeconds.time(endpoint=endpoint):
+            for attempt in range(self.retries + 1):
+                response = self.session.get(url, headers=headers, timeout=self.timeout)
+                if response.status_code in (401, 403) and attempt < self.retries:
+                    metrics.retries.inc(endpoint=endpoint, cause="auth_" + str(response.status_code))
+                    sleep(self.backoff * (2 ** attempt))
+                    self.bootstrap()
+                    continue
+                response.raise_for_status()
+                return response.content
+
+    def getJson(self, url, referer=None):
+        return json.loads(self.getRaw(url, referer))
+
+    def fetchFutures(self, symbol, expiry):
+        return json.loads(self.fetchFuturesRaw(symbol, expiry))
+
+    def optionChainUrl(self, symbol):
+        template = OPTION_CHAIN_URL if symbol in INDICES else OPTION_CHAIN_EQUITY_URL
+        return template.format(symbol=quote(symbol, safe=""))
+
+    def fetchOptionChain(self, symbol):
+        return self.getJson(self.optionChainUrl(symbol))
+
+    # Raw bytes of the option chain, for chain_parser.parseOptionChain
+    def fetchOptionChainRaw(self, symbol):
+        return self.getRaw(self.optionChainUrl(symbol))
+
+    def fetchMarketStatus(self):
+        return self.getJson(MARKET_STATUS_URL)
+
+    # Function to run several fetch calls at the same time, results come back in call order
+    def fetchMany(self, *calls):
+        futures = [self.pool.submit(fn, *args) for fn, *args in calls]
+        return [f.result() for f in futures]
+
+    # Raw bytes of the futures quote. Symbols such as M&M are quoted so they stay one query value.
+    def fetchFuturesRaw(self, symbol, expiry):
+        instrument = "FUTIDX" if symbol in INDICES else "FUTSTK"
+        query = {"symbol": quote(symbol, safe=""), "instrument": instrument, "expiry": quote(expiry, safe="")}
+        url = FUTURES_URL.format(**query)
+        referer = FUTURES_REFERER.format(**query)
+        return self.getRaw(url, referer)
+
+    # Function to fetch futures quote and option chain of one underlying concurrently,
+    # with raw=True both come back undecoded
+    def fetchFuturesAndOptionChain(self, symbol, expiry, raw=False):
+        if raw:
+            return self.fetchMany((self.fetchFuturesRaw, symbol, expiry), (self.fetchOptionChainRaw, symbol))
+        return self.fetchMany((self.fetchFutures, symbol, expiry), (self.fetchOptionChain, symbol))
+
+    def close(self):
+        self.pool.shutdown(wait=False)
+        self.session.close()
+
+
+_client = None
+_clientLock = threading.Lock()
+
+
+# Function to get the process-wide shared client. workers sizes its fetch threads and connection pool
+# when it is first built; every underlying fetched at the same time needs two (futures and option chain).
+def getClient(workers=4):
+    global _client
+    with _clientLock:
+        if _client is None:
+            _client = NseClient(workers=workers)
+        return _client
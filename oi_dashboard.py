@@ -1,135 +1,71 @@
+import argparse
 import streamlit as st
-import pandas as pd
-import requests
-from datetime import datetime
-
-# Sidebar input for custom auto-refresh interval (in minutes)
-refresh_interval_min = st.sidebar.number_input("Auto-refresh interval (minutes)", min_value=1, value=5)
-refresh_interval_sec = refresh_interval_min * 60
-
-# Initialize session state
-if "five_min_log" not in st.session_state:
-    st.session_state.five_min_log = []
-if "fifteen_min_log" not in st.session_state:
-    st.session_state.fifteen_min_log = []
-if "last_ltp" not in st.session_state:
-    st.session_state.last_ltp = 0
-
-# Function to fetch NIFTY LTP
-def fetch_nifty_ltp(session):
-    url = "https://www.nseindia.com/api/marketStatus"
-    response = session.get(url)
-    data = response.json()
-    for index in data["marketState"]:
-        if index["index"] == "NIFTY 50":
-            return float(index["last"])
-    return None
-
-# Function to fetch option chain data
-def fetch_option_chain(session):
-    url = "https://www.nseindia.com/api/option-chain-indices?symbol=NIFTY"
-    response = session.get(url)
-    data = response.json()
-    return data["records"]["data"]
-
-# Function to interpret sentiment
-def interpret_sentiment(ltp, ce_oi_change, pe_oi_change):
-    last_ltp = st.session_state.last_ltp
-    if ce_oi_change > pe_oi_change and ltp < last_ltp:
-        return "Short Buildup", "Sell"
-    elif ce_oi_change < pe_oi_change and ltp > last_ltp:
-        return "Long Buildup", "Buy"
-    elif ce_oi_change < pe_oi_change and ltp < last_ltp:
-        return "Long Unwinding", "Sell"
-    elif ce_oi_change > pe_oi_change and ltp > last_ltp:
-        return "Short Covering", "Buy"
-    else:
-        return "Neutral", "Hold"
+from chain_parser import STRIKE_WINDOW
+from dashboard_data import MarketCache, export_logs, option_chain_frame
+from nse_client import getClient
+
+# Refresh interval is a server setting, passed as: streamlit run oi_dashboard.py -- --interval 5
+parser = argparse.ArgumentParser()
+parser.add_argument("--interval", type=int, default=5, help="minutes between fetches")
+args, _ = parser.parse_known_args()
+# Strikes shown either side of ATM, the table is a slice of the cached chain
+strike_window = st.sidebar.number_input("Strikes around ATM", min_value=1, max_value=STRIKE_WINDOW, value=10)
+
+# One data layer for the whole server: every browser tab reads the same cache and only its background
+# thread talks to NSE
+@st.cache_resource
+def get_market_cache():
+    return MarketCache(getClient(), args.interval)
 
 # Streamlit UI
 st.title("NIFTY OI Analysis Dashboard")
 st.sidebar.header("Controls")
 
-# Setup session with headers
-session = requests.Session()
-session.headers.update({
-    "User-Agent": "Mozilla/5.0",
-    "Accept": "*/*",
-    "Referer": "https://www.nseindia.com"
-})
-session.get("https://www.nseindia.com")
+cache = get_market_cache()
+st.sidebar.caption(f"Fetches every {cache.interval_min} minutes in market hours.")
 
-# Button to fetch latest data
+# Button to fetch latest data; the fetch runs in the background and shows up on a later rerun
 if st.sidebar.button("Fetch Latest Data"):
-    try:
-        ltp = fetch_nifty_ltp(session)
-        option_data = fetch_option_chain(session)
-
-        ce_oi_total = sum(item.get("CE", {}).get("openInterest", 0) for item in option_data if "CE" in item)
-        pe_oi_total = sum(item.get("PE", {}).get("openInterest", 0) for item in option_data if "PE" in item)
-
-        ce_oi_change = sum(item.get("CE", {}).get("changeinOpenInterest", 0) for item in option_data if "CE" in item)
-        pe_oi_change = sum(item.get("PE", {}).get("changeinOpenInterest", 0) for item in option_data if "PE" in item)
-
-        sentiment, signal = interpret_sentiment(ltp, ce_oi_change, pe_oi_change)
-
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_entry = {
-            "Timestamp": timestamp,
-            "LTP": ltp,
-            "CE OI": ce_oi_total,
-            "PE OI": pe_oi_total,
-            "CE OI Change": ce_oi_change,
-            "PE OI Change": pe_oi_change,
-            "Sentiment": sentiment,
-            "Signal": signal
-        }
-
-        st.session_state.five_min_log.append(log_entry)
-        if len(st.session_state.five_min_log) % 3 == 0:
-            st.session_state.fifteen_min_log.append(log_entry)
-
-        st.session_state.last_ltp = ltp
-        st.success("Data fetched and logged successfully.")
-       
-        # Display Option Chain OI Analysis Table
-        st.subheader("Nifty Option Chain OI Analysis")
-        table_data = []
-        for item in option_data:
-            strike = item.get("strikePrice")
-            ce = item.get("CE", {})
-            pe = item.get("PE", {})
-            table_data.append({
-                "Strike Price": strike,
-                "CE OI": ce.get("openInterest"),
-                "CE Change OI": ce.get("changeinOpenInterest"),
-                "CE LTP": ce.get("lastPrice"),
-                "PE OI": pe.get("openInterest"),
-                "PE Change OI": pe.get("changeinOpenInterest"),
-                "PE LTP": pe.get("lastPrice")
-            })
-        df_option_chain = pd.DataFrame(table_data)
-        st.dataframe(df_option_chain)
-     # Display logs
-        st.subheader("5-Minute Log")
-        df_5min = pd.DataFrame(st.session_state.five_min_log)
-        st.dataframe(df_5min)
-
-        st.subheader("15-Minute Log")
-        df_15min = pd.DataFrame(st.session_state.fifteen_min_log)
-        st.dataframe(df_15min)
-
-    except Exception as e:
-        st.error(f"Error fetching data: {e}")
-
-# Excel export
-def export_to_excel():
-    with pd.ExcelWriter("OIAnalysisDashboard.xlsx", engine="openpyxl") as writer:
-        df_5min[["LTP", "CE OI", "PE OI", "CE OI Change", "PE OI Change", "Sentiment", "Signal"]].to_excel(writer, sheet_name="FiveMin", index=False)
-        df_15min[["LTP", "CE OI", "PE OI", "CE OI Change", "PE OI Change", "Sentiment", "Signal"]].to_excel(writer, sheet_name="FifteenMin", index=False)
-        if 'df_option_chain' in locals():
-            df_option_chain.to_excel(writer, sheet_name="OptionChain", index=False)
+    cache.request_refresh()
+    st.info("Refresh requested, data updates within a few seconds.")
+
+view = cache.view()
+chain = view["chain"]
+df_option_chain = None
+if chain is not None:
+    expiry = st.sidebar.selectbox("Expiry", chain.expiryNames.tolist())
+    df_option_chain = option_chain_frame(chain.window(strike_window, expiry))
+df_5min = view["five_min"]
+df_15min = view["fifteen_min"]
+
+if view["error"]:
+    st.error(f"Error fetching data: {view['error']}")
+if view["fetched_at"] is None:
+    st.info("Waiting for the first fetch from NSE.")
+else:
+    st.caption(f"Last fetched at {view['fetched_at'].strftime('%Y-%m-%d %H:%M:%S')}")
+
+if df_option_chain is not None:
+    # Display Option Chain OI Analysis Table
+    st.subheader("Nifty Option Chain OI Analysis")
+    st.dataframe(df_option_chain)
+if view["analytics"] is not None:
+    st.subheader("Expiry Analytics")
+    st.dataframe(view["analytics"])
+# Display logs, kept history shows up even before the first fetch
+st.subheader("5-Minute Log")
+st.dataframe(df_5min)
+
+st.subheader("15-Minute Log")
+st.dataframe(df_15min)
+
+# Excel export of the rows logged since the previous export, from the shared cache so it works on any rerun
+def export_to_excel(view, option_chain):
+    return export_logs(view, option_chain, "OIAnalysisDashboard")
 
 if st.sidebar.button("Download Excel"):
-    export_to_excel()
-    st.success("Excel file 'OIAnalysisDashboard.xlsx' has been created.")
+    written = export_to_excel(view, df_option_chain)
+    if written:
+        st.success("Exported to " + ", ".join(written))
+    else:
+        st.info("Nothing new to export since the last export.")
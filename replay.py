@@ -0,0 +1,150 @@
+import argparse
+import gzip
+import json
+import os
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from archive import SnapshotArchive
+from chain_parser import parseOptionChain
+from OiAnalysis import STRIKE_WINDOW, SymbolCollector
+from signals import BUY, SELL, signal
+from sinks import ParquetSink, Sink
+
+# Recorded snapshots live in <root>/<SYMBOL>/ as a pair of files per tick:
+#   20200911-0920.futures.json   and   20200911-0920.options.json   (optionally .gz)
+STAMP_FORMAT = "%Y%m%d-%H%M"
+FUTURES_SUFFIX = ".futures.json"
+OPTIONS_SUFFIX = ".options.json"
+
+
+def readPayload(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        return f.read()
+
+
+# Function to record one tick's raw payloads in the replay layout
+def saveSnapshot(root, symbol, timestamp, futRaw, optRaw, compress=True):
+    folder = os.path.join(root, symbol)
+    os.makedirs(folder, exist_ok=True)
+    stamp = timestamp.strftime(STAMP_FORMAT)
+    for suffix, raw in ((FUTURES_SUFFIX, futRaw), (OPTIONS_SUFFIX, optRaw)):
+        path = os.path.join(folder, stamp + suffix + (".gz" if compress else ""))
+        with (gzip.open if compress else open)(path, "wb") as f:
+            f.write(raw)
+
+
+# Function to list recorded ticks of a symbol in time order as (timestamp, futures path, options path)
+def listSnapshots(root, symbol, start=None, end=None):
+    folder = os.path.join(root, symbol)
+    pairs = {}
+    for name in os.listdir(folder) if os.path.isdir(folder) else []:
+        base = name[:-3] if name.endswith(".gz") else name
+        for kind, suffix in (("futures", FUTURES_SUFFIX), ("options", OPTIONS_SUFFIX)):
+            if base.endswith(suffix):
+                timestamp = datetime.strptime(base[:-len(suffix)], STAMP_FORMAT)
+                pairs.setdefault(timestamp, {})[kind] = os.path.join(folder, name)
+    ticks = []
+    for timestamp in sorted(pairs):
+        paths = pairs[timestamp]
+        if "futures" not in paths or "options" not in paths:
+            continue
+        if (start is None or timestamp >= start) and (end is None or timestamp <= end):
+            ticks.append((timestamp, paths["futures"], paths["options"]))
+    return ticks
+
+
+# Function to yield recorded ticks as (timestamp, futures bytes, option chain bytes)
+def iterSnapshots(root, symbol, start=None, end=None):
+    for timestamp, futPath, optPath in listSnapshots(root, symbol, start, end):
+        yield timestamp, readPayload(futPath), readPayload(optPath)
+
+
+# Sink keeping the closed bars the collector hands to its sinks, by timeframe
+class BarRecorder(Sink):
+    def __init__(self):
+        self.bars = {}
+
+    def writeBar(self, symbol, minutes, bar):
+        self.bars.setdefault(minutes, []).append(dict(bar))
+
+
+# Function to push recorded ticks through the live collector path (snapshot, bars, sinks) without
+# waiting for the clock. Returns every futures snapshot as a DataFrame and the bars written to the
+# sinks as {minutes: DataFrame}.
+def replay(collector, snapshots):
+    snaps = []
+    recorder = BarRecorder()
+    collector.sinks.append(recorder)
+    try:
+        for timestamp, futRaw, optRaw in snapshots:
+            snaps.append(collector.process(timestamp, json.loads(futRaw), parseOptionChain(optRaw)))
+    finally:
+        collector.sinks.remove(recorder)
+    return pd.DataFrame(snaps), {minutes: pd.DataFrame(bars) for minutes, bars in recorder.bars.items()}
+
+
+# Function to measure how often the Buy/Sell signals of the pipeline were right: a Buy is a hit when
+# LTP is higher `horizon` rows later on the same day, a Sell when it is lower. Signals come from the
+# changes the collector wrote, so the baseline tick of a day (all changes 0) gives none.
+def hitRates(df, horizons=(1, 3, 6), price="lastTraded", time="timestamp"):
+    ltp = df[price].to_numpy(dtype=float)
+    day = pd.to_datetime(df[time]).dt.date.to_numpy()
+    signal = signalsOf(df)
+    rows = []
+    for horizon in horizons:
+        if horizon >= len(ltp):
+            continue
+        move = ltp[horizon:] - ltp[:-horizon]
+        sameDay = day[horizon:] == day[:-horizon]
+        for name, direction in ((BUY, 1), (SELL, -1)):
+            mask = (signal[:-horizon] == name) & sameDay
+            count = int(mask.sum())
+            hits = int((direction * move[mask] > 0).sum())
+            rows.append({"signal": name, "horizon": horizon, "count": count, "hits": hits,
+                         "hitRate": hits / count if count else np.nan,
+                         "avgMove": float(direction * move[mask].mean()) if count else np.nan})
+    return pd.DataFrame(rows, columns=["signal", "horizon", "count", "hits", "hitRate", "avgMove"])
+
+
+# Function to get the Buy/Sell signal of every snapshot or bar from the changes it was written with
+def signalsOf(df):
+    return signal(df["changeInLTP"], df["changeInFutOI"], df["changeInCallOI"], df["changeInPutOI"])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay recorded NSE snapshots through the collector pipeline")
+    parser.add_argument("root", help="folder holding <SYMBOL>/<YYYYMMDD-HHMM>.futures.json/.options.json pairs")
+    parser.add_argument("--archive", action="store_true", help="root is a snapshot archive written by OiAnalysis.py --archive-dir")
+    parser.add_argument("--symbol", default="NIFTY")
+    parser.add_argument("--sink", action="append", choices=["parquet"], help="also write replayed ticks to a sink")
+    parser.add_argument("--data-dir", default="replay_data", help="root folder of the parquet store")
+    parser.add_argument("--strike-window", type=int, default=STRIKE_WINDOW,
+                        help="strikes kept either side of ATM of every expiry, 0 keeps the whole chain")
+    parser.add_argument("--horizon", type=int, nargs="+", default=[1, 3, 6], help="rows ahead to score signals")
+    parser.add_argument("--minutes", type=int, nargs="*", default=[15], help="also score signals on these bars")
+    args = parser.parse_args()
+
+    sinks = [ParquetSink(args.data_dir) for name in args.sink or []]
+    collector = SymbolCollector(args.symbol, sinks, strikeWindow=args.strike_window)
+    started = datetime.now()
+    try:
+        if args.archive:
+            snapshots = SnapshotArchive(args.root).iterSnapshots(args.symbol)
+        else:
+            snapshots = iterSnapshots(args.root, args.symbol)
+        df, bars = replay(collector, snapshots)
+    finally:
+        for sink in sinks:
+            sink.close()
+    print(len(df), "ticks replayed in", datetime.now() - started)
+    if not df.empty:
+        print("Tick signals")
+        print(hitRates(df, args.horizon).to_string(index=False))
+        for minutes in args.minutes:
+            if minutes not in bars:
+                print("No", minutes, "min bars were written")
+                continue
+            print(str(minutes) + " min bar signals")
+            print(hitRates(bars[minutes], args.horizon, time="end").to_string(index=False))
@@ -0,0 +1,82 @@
+import math
+from datetime import timedelta
+
+DAY = 1440
+
+
+# Function to get the end of the clock-aligned bar a timestamp belongs to.
+# Bars are right-closed: with 15 minutes, 9:16 to 9:30 (both inclusive) fall in the bar ending 9:30.
+def barEnd(timestamp, minutes):
+    midnight = timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    elapsed = (timestamp - midnight).total_seconds()
+    return midnight + timedelta(minutes=math.ceil(elapsed / (minutes * 60)) * minutes)
+
+
+# Incrementally builds one timeframe of bars from a stream of snapshots.
+# Only the running bar is kept: open/high/low of `price` plus the latest value of every other field.
+# A bar is handed back as soon as a snapshot lands on its end, or when the first snapshot of a
+# later bar arrives (a missed or late tick never shifts the following bars).
+class BarBuilder:
+    def __init__(self, minutes, price="lastTraded"):
+        self.minutes = minutes
+        self.price = price
+        self.bar = None
+
+    def update(self, timestamp, values):
+        closed = []
+        end = barEnd(timestamp, self.minutes)
+        if self.bar is not None and self.bar["end"] != end:
+            closed.append(self.bar)
+            self.bar = None
+        price = values[self.price]
+        if self.bar is None:
+            self.bar = {"start": end - timedelta(minutes=self.minutes), "end": end,
+                        "open": price, "high": price, "low": price, "count": 0}
+        bar = self.bar
+        bar.update(values)
+        bar["high"] = max(bar["high"], price)
+        bar["low"] = min(bar["low"], price)
+        bar["count"] += 1
+        if timestamp >= end:
+            closed.append(bar)
+            self.bar = None
+        return closed
+
+    # Function to hand back the running bar, e.g. at end of session
+    def flush(self):
+        bar, self.bar = self.bar, None
+        return [bar] if bar is not None else []
+
+
+# Keeps one BarBuilder per timeframe; adding a timeframe costs one dict update per tick.
+class Resampler:
+    def __init__(self, timeframes=(15, 30, 60, DAY), price="lastTraded"):
+        self.builders = {minutes: BarBuilder(minutes, price) for minutes in timeframes}
+
+    # Function to feed one snapshot, returns {minutes: [closed bars]} for timeframes that closed
+    def update(self, timestamp, values):
+        closed = {}
+        for minutes, builder in self.builders.items():
+            bars = builder.update(timestamp, values)
+            if bars:
+                closed[minutes] = bars
+        return closed
+
+    def flush(self):
+        return {minutes: builder.flush() for minutes, builder in self.builders.items() if builder.bar is not None}
+
+
+# Function to resample stored snapshot history into bars in one go, same bar rules as BarBuilder
+def resampleFrame(df, minutes, price="lastTraded", time="timestamp"):
+    if df.empty:
+        return df
+    grouped = df.set_index(time).resample(str(minutes) + "min", closed="right", label="right")
+    bars = grouped.last()
+    ohlc = grouped[price].ohlc()
+    bars["open"] = ohlc["open"]
+    bars["high"] = ohlc["high"]
+    bars["low"] = ohlc["low"]
+    bars["count"] = grouped[price].count()
+    bars = bars[bars["count"] > 0]
+    bars.index.name = "end"
+    return bars.reset_index()
@@ -0,0 +1,74 @@
+import json
+import os
+import numpy as np
+
+HEADER = "ring.json"
+
+
+# Fixed-size history of rows kept as one memory-mapped .npy file per column under `folder`, so the
+# window survives restarts and every process that opens the folder sees the same rows. Each row is
+# written twice, at slot i and i + capacity, which keeps any tail window of up to `capacity` rows
+# contiguous: tail() returns views into the mapped files, never copies. Tail windows stop at
+# capacity - 1 rows, leaving one slot of slack so a published view never covers the slot the next
+# append writes. Appends are O(1) and memory stays at 2 * capacity rows per column however long the
+# collector runs.
+class RingBuffer:
+    def __init__(self, folder, fields, capacity):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        header = os.path.join(folder, HEADER)
+        if os.path.exists(header):
+            with open(header) as f:
+                saved = json.load(f)
+            if saved["fields"] != [[name, np.dtype(dtype).str] for name, dtype in fields] or saved["capacity"] != capacity:
+                raise ValueError("ring buffer in " + folder + " has a different layout, move it away to start a new one")
+            mode = "r+"
+        else:
+            saved = {"fields": [[name, np.dtype(dtype).str] for name, dtype in fields], "capacity": capacity}
+            mode = "w+"
+        self.capacity = capacity
+        self.names = [name for name, _ in fields]
+        self.columns = {}
+        for i, (name, dtype) in enumerate(fields):
+            path = os.path.join(folder, "{}.npy".format(i))
+            if mode == "w+":
+                self.columns[name] = np.lib.format.open_memmap(path, mode=mode, dtype=dtype, shape=(2 * capacity,))
+            else:
+                self.columns[name] = np.lib.format.open_memmap(path, mode=mode)
+        # count[0] is the number of rows ever appended; it is written after the row so readers never see half a row
+        self.count = np.lib.format.open_memmap(os.path.join(folder, "count.npy"), mode=mode, dtype=np.int64, shape=(1,))
+        if mode == "w+":
+            with open(header, "w") as f:
+                json.dump(saved, f)
+
+    def __len__(self):
+        return int(min(self.count[0], self.capacity))
+
+    # Function to add one row given as a dict of field values, the oldest row drops out when full
+    def append(self, row):
+        n = int(self.count[0])
+        slot = n % self.capacity
+        for name in self.names:
+            column = self.columns[name]
+            column[slot] = column[slot + self.capacity] = row[name]
+        self.count[0] = n + 1
+
+    # Function to get the last n rows (all kept rows if n is None) as a dict of read-only array views,
+    # at most capacity - 1 rows so the views stay valid across the next append
+    def tail(self, n=None):
+        total = int(self.count[0])
+        limit = min(len(self), self.capacity - 1)
+        n = limit if n is None else min(n, limit)
+        # past the first lap the newest rows are read from the upper copy
+        end = total if total <= self.capacity else (total - 1) % self.capacity + 1 + self.capacity
+        views = {}
+        for name in self.names:
+            view = self.columns[name][end - n:end].view(np.ndarray)
+            view.flags.writeable = False
+            views[name] = view
+        return views
+
+    def flush(self):
+        for column in self.columns.values():
+            column.flush()
+        self.count.flush()
@@ -0,0 +1,154 @@
+import calendar
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
+import metrics
+
+MARKET_OPEN = time(9, 15)
+MARKET_CLOSE = time(15, 30)
+
+
+# Function to get the first wall-clock boundary (multiple of `minutes` since midnight) after now
+def nextBoundary(now, minutes):
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    elapsed = now.hour * 60 + now.minute
+    return midnight + timedelta(minutes=(elapsed // minutes + 1) * minutes)
+
+
+# Function to check whether a tick falls inside market hours of a trading weekday
+def inSession(moment, start=MARKET_OPEN, end=MARKET_CLOSE):
+    return moment.weekday() < 5 and start <= moment.time() <= end
+
+
+def lastWeekdayOfMonth(year, month, weekday):
+    lastDay = calendar.monthrange(year, month)[1]
+    day = date(year, month, lastDay)
+    return day - timedelta(days=(day.weekday() - weekday) % 7)
+
+
+def parseExpiry(text):
+    for fmt in ("%d-%b-%Y", "%d%b%Y"):
+        try:
+            return datetime.strptime(text.title(), fmt).date()
+        except ValueError:
+            continue
+    raise ValueError("Unknown expiry format: " + text)
+
+
+# Function to format an expiry the way the futures quote endpoint wants it (24SEP2020)
+def futuresExpiryText(day):
+    return day.strftime("%d%b%Y").upper()
+
+
+# Function to find the current monthly futures expiry on a given day.
+# The option chain's expiry list is preferred since it already accounts for holidays:
+# the monthly expiry is the last listed expiry in the month of the nearest upcoming one.
+# Without it the last `weekday` (Thursday by default) of the month is used.
+def monthlyExpiry(day, expiryDates=None, weekday=3):
+    upcoming = sorted(d for d in (parseExpiry(e) for e in expiryDates or []) if d >= day)
+    if upcoming:
+        first = upcoming[0]
+        return max(d for d in upcoming if (d.year, d.month) == (first.year, first.month))
+    expiry = lastWeekdayOfMonth(day.year, day.month, weekday)
+    if expiry < day:
+        year, month = (day.year + 1, 1) if day.month == 12 else (day.year, day.month + 1)
+        expiry = lastWeekdayOfMonth(year, month, weekday)
+    return expiry
+
+
+# Runs every job on exact wall-clock boundaries of `interval` minutes during market hours.
+# Each job is a callable taking the boundary datetime; jobs run concurrently on a thread pool and
+# a job still busy with the previous boundary is skipped instead of piling up, so ticks never drift.
+# Skipped, failed and overslept boundaries are counted per job in metrics.missedSlots.
+# afterBoundary, if given, is called with the boundary once every job fired for it has finished,
+# e.g. to checkpoint shared state once per boundary instead of once per job.
+class Scheduler:
+    def __init__(self, jobs, interval=5, workers=None, start=MARKET_OPEN, end=MARKET_CLOSE, afterBoundary=None):
+        self.jobs = list(jobs)
+        self.afterBoundary = afterBoundary
+        self.interval = interval
+        self.start = start
+        self.end = end
+        self.pool = ThreadPoolExecutor(max_workers=workers or max(4, len(self.jobs)), thread_name_prefix="collector")
+        self.running = set()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.skipped = 0
+        self.lastBoundary = None
+
+    def runJob(self, job, boundary):
+        try:
+            job(boundary)
+        except Exception as e:
+            metrics.missedSlots.inc(symbol=getattr(job, "name", job), cause="error")
+            print(boundary.strftime("%H:%M"), getattr(job, "name", job), e)
+        finally:
+            with self.lock:
+                self.running.discard(job)
+
+    def fire(self, boundary):
+        futures = []
+        for job in self.jobs:
+            with self.lock:
+                if job in self.running:
+                    self.skipped += 1
+                    metrics.missedSlots.inc(symbol=getattr(job, "name", job), cause="busy")
+                    continue
+                self.running.add(job)
+            futures.append(self.pool.submit(self.runJob, job, boundary))
+        if self.afterBoundary is not None and futures:
+            remaining = [len(futures)]
+
+            def done(future):
+                with self.lock:
+                    remaining[0] -= 1
+                    if remaining[0]:
+                        return
+                try:
+                    self.afterBoundary(boundary)
+                except Exception as e:
+                    print(boundary.strftime("%H:%M"), "afterBoundary", e)
+
+            for future in futures:
+                future.add_done_callback(done)
+
+    # Function to count in-session boundaries between the last fired one and boundary that never fired,
+    # e.g. while the machine slept or a tick callback blocked the loop
+    def countOverslept(self, boundary):
+        last = self.lastBoundary
+        self.lastBoundary = boundary
+        if last is None:
+            return
+        missed = 0
+        moment = last + timedelta(minutes=self.interval)
+        while moment < boundary:
+            if inSession(moment, self.start, self.end):
+                missed += 1
+            moment += timedelta(minutes=self.interval)
+        if missed:
+            for job in self.jobs:
+                metrics.missedSlots.inc(missed, symbol=getattr(job, "name", job), cause="late")
+
+    # Function to run every job right away instead of waiting for the next boundary, so a collector
+    # started or restarted during market hours has data within a second or so of launch
+    def fireNow(self):
+        now = datetime.now().replace(microsecond=0)
+        if inSession(now, self.start, self.end):
+            self.lastBoundary = nextBoundary(now, self.interval) - timedelta(minutes=self.interval)
+            self.fire(now)
+
+    def run(self, immediate=True):
+        if immediate:
+            self.fireNow()
+        while not self.stopped.is_set():
+            boundary = nextBoundary(datetime.now(), self.interval)
+            wait = (boundary - datetime.now()).total_seconds()
+            if self.stopped.wait(max(wait, 0)):
+                break
+            if inSession(boundary, self.start, self.end):
+                self.countOverslept(boundary)
+                self.fire(boundary)
+
+    def stop(self):
+        self.stopped.set()
+        self.pool.shutdown(wait=True)
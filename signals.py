@@ -0,0 +1,65 @@
+import numpy as np
+
+LONG_BUILDUP = "Long Buildup"
+SHORT_BUILDUP = "Short Buildup"
+LONG_UNWINDING = "Long Unwinding"
+SHORT_COVERING = "Short Covering"
+BUY = "Buy"
+SELL = "Sell"
+
+
+# Function to get the change of every row against the previous one, the first row has no previous row so its change is 0
+def changes(values):
+    values = np.asarray(values, dtype=float)
+    out = np.zeros_like(values)
+    out[1:] = np.diff(values)
+    return out
+
+
+# Function to get OI interpretation from change in futures LTP and change in futures OI
+def interpretation(changeInLTP, changeInFutOI):
+    ltp = np.asarray(changeInLTP)
+    fut = np.asarray(changeInFutOI)
+    conditions = [(ltp > 0) & (fut > 0), (ltp < 0) & (fut > 0), (ltp < 0) & (fut < 0), (ltp > 0) & (fut < 0)]
+    return np.select(conditions, [LONG_BUILDUP, SHORT_BUILDUP, LONG_UNWINDING, SHORT_COVERING], default="")
+
+
+# Function to get Buy/Sell signal.
+# Buy:  LTP up with futures OI moving (Long Buildup or Short Covering), put OI up and call OI down
+# Sell: LTP down with futures OI moving (Short Buildup or Long Unwinding), put OI down and call OI up
+def signal(changeInLTP, changeInFutOI, changeInCallOI, changeInPutOI):
+    ltp = np.asarray(changeInLTP)
+    fut = np.asarray(changeInFutOI)
+    call = np.asarray(changeInCallOI)
+    put = np.asarray(changeInPutOI)
+    buy = (ltp > 0) & (fut != 0) & (put > 0) & (call < 0)
+    sell = (ltp < 0) & (fut != 0) & (put < 0) & (call > 0)
+    return np.select([buy, sell], [BUY, SELL], default="")
+
+
+# Function to compute changes, interpretation and signal for a whole series of snapshots in one pass
+def analyse(ltp, futOI, callOI, putOI):
+    changeInLTP = changes(ltp)
+    changeInFutOI = changes(futOI)
+    changeInCallOI = changes(callOI)
+    changeInPutOI = changes(putOI)
+    return {
+        "changeInLTP": changeInLTP,
+        "changeInFutOI": changeInFutOI,
+        "changeInCallOI": changeInCallOI,
+        "changeInPutOI": changeInPutOI,
+        "interpretation": interpretation(changeInLTP, changeInFutOI),
+        "signal": signal(changeInLTP, changeInFutOI, changeInCallOI, changeInPutOI),
+    }
+
+
+# Function to get interpretation and signal of a single tick from its changes
+def interpretTick(changeInLTP, changeInFutOI, changeInCallOI, changeInPutOI):
+    return (str(interpretation(changeInLTP, changeInFutOI)),
+            str(signal(changeInLTP, changeInFutOI, changeInCallOI, changeInPutOI)))
+
+
+# Function to add change, interpretation and signal columns to a DataFrame of snapshots
+def addSignalColumns(df, ltp="lastTraded", futOI="futOI", callOI="callOI", putOI="putOI"):
+    result = analyse(df[ltp].to_numpy(), df[futOI].to_numpy(), df[callOI].to_numpy(), df[putOI].to_numpy())
+    return df.assign(**result)
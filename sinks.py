@@ -0,0 +1,347 @@
+import os
+import queue
+import threading
+from datetime import datetime
+import pyarrow as pa
+import pyarrow.parquet as pq
+import metrics
+
+FUTURES = "futures"
+OPTIONS = "options"
+ANALYTICS = "analytics"
+BARS = "bars"
+
+futuresSchema = pa.schema([
+    ("timestamp", pa.timestamp("s")),
+    ("symbol", pa.string()),
+    ("expiry", pa.string()),
+    ("lastTraded", pa.float64()),
+    ("tradedVolCon", pa.int64()),
+    ("futOI", pa.int64()),
+    ("callOI", pa.int64()),
+    ("putOI", pa.int64()),
+])
+
+optionsSchema = pa.schema([
+    ("timestamp", pa.timestamp("s")),
+    ("symbol", pa.string()),
+    ("expiry", pa.string()),
+    ("strike", pa.float64()),
+    ("ceOI", pa.int64()),
+    ("ceChgOI", pa.int64()),
+    ("ceLTP", pa.float64()),
+    ("ceIV", pa.float64()),
+    ("ceVol", pa.int64()),
+    ("peOI", pa.int64()),
+    ("peChgOI", pa.int64()),
+    ("peLTP", pa.float64()),
+    ("peIV", pa.float64()),
+    ("peVol", pa.int64()),
+    ("ceOIDelta", pa.int64()),
+    ("peOIDelta", pa.int64()),
+    ("ceLTPDelta", pa.float64()),
+    ("peLTPDelta", pa.float64()),
+    ("ceModelIV", pa.float64()),
+    ("peModelIV", pa.float64()),
+    ("ceDelta", pa.float64()),
+    ("peDelta", pa.float64()),
+    ("ceGamma", pa.float64()),
+    ("peGamma", pa.float64()),
+    ("ceVega", pa.float64()),
+    ("peVega", pa.float64()),
+    ("ceTheta", pa.float64()),
+    ("peTheta", pa.float64()),
+])
+
+analyticsSchema = pa.schema([
+    ("timestamp", pa.timestamp("s")),
+    ("symbol", pa.string()),
+    ("expiry", pa.string()),
+    ("ceOI", pa.int64()),
+    ("peOI", pa.int64()),
+    ("ceVol", pa.int64()),
+    ("peVol", pa.int64()),
+    ("pcrOI", pa.float64()),
+    ("pcrVol", pa.float64()),
+    ("maxPain", pa.float64()),
+    ("topCeOI", pa.list_(pa.float64())),
+    ("topPeOI", pa.list_(pa.float64())),
+    ("topCeChgOI", pa.list_(pa.float64())),
+    ("topPeChgOI", pa.list_(pa.float64())),
+    ("atmStrike", pa.float64()),
+    ("atmIV", pa.float64()),
+    ("otmPutIV", pa.float64()),
+    ("otmCallIV", pa.float64()),
+    ("ivSkew", pa.float64()),
+    ("gex", pa.float64()),
+])
+
+barsSchema = pa.schema([
+    ("start", pa.timestamp("s")),
+    ("end", pa.timestamp("s")),
+    ("symbol", pa.string()),
+    ("expiry", pa.string()),
+    ("open", pa.float64()),
+    ("high", pa.float64()),
+    ("low", pa.float64()),
+    ("lastTraded", pa.float64()),
+    ("tradedVolCon", pa.int64()),
+    ("futOI", pa.int64()),
+    ("callOI", pa.int64()),
+    ("putOI", pa.int64()),
+    ("count", pa.int64()),
+    ("changeInLTP", pa.float64()),
+    ("changeInFutOI", pa.int64()),
+    ("changeInCallOI", pa.int64()),
+    ("changeInPutOI", pa.int64()),
+])
+
+# Ticks written to one Parquet part before it is closed and the next part started (an hour of 5 min ticks)
+ROLL_TICKS = 12
+
+schemas = {FUTURES: futuresSchema, OPTIONS: optionsSchema, ANALYTICS: analyticsSchema, BARS: barsSchema}
+
+
+# Function to get the store kind of bars of one timeframe, e.g. bars/15, stored under <root>/bars/15/<symbol>/
+def barKind(minutes):
+    return BARS + "/" + str(minutes)
+
+
+# Function to get the schema of a store kind, all bar timeframes share barsSchema
+def schemaOf(kind):
+    return schemas[kind.split("/")[0]]
+
+
+# Base class for a place where collected ticks are stored.
+# snap is the futures snapshot dict built by the collector, chain is the parsed chain_parser.OptionChainTable.
+class Sink:
+    def open(self):
+        pass
+
+    def writeBaseline(self, snap, chain):
+        self.writeFutures(snap)
+        self.writeOptionChain(snap, chain)
+
+    def writeFutures(self, snap):
+        pass
+
+    # bar is a closed bar of `minutes` built from the futures snapshots of symbol (see resample.py)
+    def writeBar(self, symbol, minutes, bar):
+        pass
+
+    def writeOptionChain(self, snap, chain):
+        pass
+
+    # analytics holds one row per expiry of chain as built by chain_analytics.analyseChain
+    def writeAnalytics(self, snap, analytics):
+        pass
+
+    def close(self):
+        pass
+
+
+# Function to cast a stored table to schema, columns added to the schema since it was written become nulls
+def conformTable(table, schema):
+    columns = [table[field.name] if field.name in table.column_names else pa.nulls(len(table), field.type)
+               for field in schema]
+    return pa.Table.from_arrays(columns, names=schema.names).cast(schema)
+
+
+# Function to call sink.write<kind>(*args) timed into the sink write latency histogram
+def writeTo(sink, kind, *args):
+    with metrics.writeSeconds.time(sink=type(sink).__name__, kind=kind):
+        getattr(sink, "write" + kind)(*args)
+
+
+# Runs the writes of another sink on its own thread behind a bounded queue, so a slow sink (Excel,
+# a network disk) never holds up collection. Writes keep their order; when the queue is full the
+# write is dropped and counted in oi_dropped_writes_total instead of blocking the collector.
+class QueuedSink(Sink):
+    def __init__(self, sink, maxsize=10000):
+        self.sink = sink
+        self.name = type(sink).__name__
+        self.queue = queue.Queue(maxsize)
+        self.thread = threading.Thread(target=self.run, name="sink-" + self.name, daemon=True)
+
+    def open(self):
+        self.sink.open()
+        self.thread.start()
+
+    def submit(self, kind, *args):
+        try:
+            self.queue.put_nowait((kind, args))
+        except queue.Full:
+            metrics.droppedWrites.inc(sink=self.name, kind=kind)
+
+    def writeBaseline(self, snap, chain):
+        self.submit("Baseline", snap, chain)
+
+    def writeFutures(self, snap):
+        self.submit("Futures", snap)
+
+    def writeBar(self, symbol, minutes, bar):
+        self.submit("Bar", symbol, minutes, bar)
+
+    def writeOptionChain(self, snap, chain):
+        self.submit("OptionChain", snap, chain)
+
+    def writeAnalytics(self, snap, analytics):
+        self.submit("Analytics", snap, analytics)
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            kind, args = item
+            try:
+                writeTo(self.sink, kind, *args)
+            except Exception as e:
+                metrics.failures.inc(symbol=args[0] if kind == "Bar" else args[0]["symbol"], stage="write",
+                                     cause=metrics.failureCause(e))
+                print(self.name, kind, e)
+
+    # Function to write out everything queued, then close the wrapped sink
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self.sink.close()
+
+
+# Append-only columnar store with one Parquet file per day per underlying:
+#   <root>/futures/<symbol>/<YYYY-MM-DD>.parquet
+#   <root>/options/<symbol>/<YYYY-MM-DD>.parquet
+#   <root>/analytics/<symbol>/<YYYY-MM-DD>.parquet
+#   <root>/bars/<minutes>/<symbol>/<YYYY-MM-DD>.parquet (by the day the bar starts)
+# Every tick is written as one row group into an open writer, so nothing is re-read while collecting.
+# A restart during the day adds a <YYYY-MM-DD>.<n>.parquet part next to the earlier ones.
+class ParquetSink(Sink):
+    def __init__(self, root="data", rollTicks=ROLL_TICKS):
+        self.root = root
+        self.rollTicks = rollTicks
+        self.writers = {}
+        self.lock = threading.Lock()
+
+    # Function to get the file the next writer of a day writes to: <day>.parquet, or <day>.<n>.parquet
+    # for later parts of the day, so existing files are never read or rewritten
+    def partitionPath(self, kind, symbol, day):
+        return partPath(os.path.join(self.root, kind, symbol, day.strftime("%Y-%m-%d")), ".parquet")
+
+    # Function to move parts of a day left without footer by a crashed run aside as .partial, so they are
+    # reported once instead of being skipped silently by every read
+    def setAsideBroken(self, kind, symbol, day):
+        for _, _, path in historyFiles(self.root, kind, symbol, day, day):
+            if not hasFooter(path):
+                os.replace(path, path + ".partial")
+                print("Unreadable", path, "left by an earlier run moved to", path + ".partial")
+
+    # Function to get the writer of a kind and symbol. A part is closed, footer and all, after rollTicks
+    # writes or when the day changes, so a crash loses at most rollTicks ticks and readers see every
+    # closed part while the collector runs.
+    def getWriter(self, kind, symbol, timestamp):
+        key = (kind, symbol)
+        day = timestamp.date()
+        current = self.writers.get(key)
+        if current is not None and current[0] == day and current[3] < self.rollTicks:
+            current[3] += 1
+            return current[2]
+        if current is not None:
+            current[2].close()
+        if current is None or current[0] != day:
+            self.setAsideBroken(kind, symbol, day)
+        path = self.partitionPath(kind, symbol, day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        writer = pq.ParquetWriter(path, schemaOf(kind))
+        self.writers[key] = [day, path, writer, 1]
+        return writer
+
+    def writeFutures(self, snap):
+        row = {name: [snap[name]] for name in futuresSchema.names}
+        with self.lock:
+            writer = self.getWriter(FUTURES, snap["symbol"], snap["timestamp"])
+            writer.write_table(pa.Table.from_pydict(row, schema=futuresSchema))
+
+    def writeBar(self, symbol, minutes, bar):
+        row = {name: [bar[name]] for name in barsSchema.names}
+        row["symbol"] = [symbol]
+        with self.lock:
+            writer = self.getWriter(barKind(minutes), symbol, bar["start"])
+            writer.write_table(pa.Table.from_pydict(row, schema=barsSchema))
+
+    def writeOptionChain(self, snap, chain):
+        cols = chain.columns()
+        cols["timestamp"] = pa.array([snap["timestamp"]] * len(chain), pa.timestamp("s"))
+        cols["symbol"] = pa.array([snap["symbol"]] * len(chain), pa.string())
+        table = pa.Table.from_pydict(cols, schema=optionsSchema)
+        with self.lock:
+            writer = self.getWriter(OPTIONS, snap["symbol"], snap["timestamp"])
+            writer.write_table(table)
+
+    def writeAnalytics(self, snap, analytics):
+        cols = {name: (values.tolist() if values.ndim > 1 else values) for name, values in analytics.items()}
+        cols["timestamp"] = pa.array([snap["timestamp"]] * len(analytics["expiry"]), pa.timestamp("s"))
+        cols["symbol"] = pa.array([snap["symbol"]] * len(analytics["expiry"]), pa.string())
+        table = pa.Table.from_pydict(cols, schema=analyticsSchema)
+        with self.lock:
+            writer = self.getWriter(ANALYTICS, snap["symbol"], snap["timestamp"])
+            writer.write_table(table)
+
+    def close(self):
+        with self.lock:
+            for day, path, writer, writes in self.writers.values():
+                writer.close()
+            self.writers = {}
+
+
+# Function to get the first of <base><suffix>, <base>.1<suffix>, <base>.2<suffix>... that does not exist yet,
+# so a restarted writer adds a part instead of rewriting what an earlier run wrote
+def partPath(base, suffix):
+    path = base + suffix
+    part = 0
+    while os.path.exists(path):
+        part += 1
+        path = "{}.{}{}".format(base, part, suffix)
+    return path
+
+
+# Function to list the stored files of one underlying between two dates (inclusive) as sorted
+# (day, part, path) tuples, file names being <day>.parquet or <day>.<part>.parquet
+def historyFiles(root, kind, symbol, start=None, end=None):
+    folder = os.path.join(root, kind, symbol)
+    if not os.path.isdir(folder):
+        return []
+    files = []
+    for name in os.listdir(folder):
+        if not name.endswith(".parquet"):
+            continue
+        parts = name[:-len(".parquet")].split(".")
+        day = datetime.strptime(parts[0], "%Y-%m-%d").date()
+        if (start is None or day >= start) and (end is None or day <= end):
+            files.append((day, int(parts[1]) if len(parts) > 1 else 0, os.path.join(folder, name)))
+    return sorted(files)
+
+
+# Function to check whether a Parquet file is complete: it ends with its footer and the PAR1 magic
+def hasFooter(path):
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() < 12:
+            return False
+        f.seek(-4, os.SEEK_END)
+        return f.read(4) == b"PAR1"
+
+
+# Function to read stored history of one underlying between two dates (inclusive) as a DataFrame.
+# The part a running collector is still writing has no footer yet and is left out; it is reported
+# so a part left broken by a crash does not go unnoticed.
+def readHistory(root, kind, symbol, start=None, end=None):
+    tables = []
+    for day, part, f in historyFiles(root, kind, symbol, start, end):
+        if not hasFooter(f):
+            print("Skipped", f, "(still being written, or left by a crashed run)")
+            continue
+        tables.append(conformTable(pq.read_table(f), schemaOf(kind)))
+    if not tables:
+        return schemaOf(kind).empty_table().to_pandas()
+    return pa.concat_tables(tables).to_pandas()
@@ -0,0 +1,120 @@
+import json
+import os
+import threading
+from datetime import date
+import numpy as np
+from scheduler import parseExpiry
+
+TICK = "tick"
+FUTURES_FIELDS = ("lastTraded", "futOI", "callOI", "putOI")
+CHANGE_FIELDS = ("changeInLTP", "changeInFutOI", "changeInCallOI", "changeInPutOI")
+STRIKE_FIELDS = ("ceOI", "peOI", "ceLTP", "peLTP")
+
+
+# Strike in paise goes below this in a key, room for strikes up to 1 crore (MRF trades above 1 lakh)
+KEY_SCALE = 10**9
+
+
+# Function to get the date ordinal of the expiry of every row
+def expiryOrdinals(expiry):
+    if len(expiry) == 0:
+        return np.empty(0, dtype=np.int64)
+    names, inverse = np.unique(expiry, return_inverse=True)
+    ordinals = np.array([parseExpiry(str(name)).toordinal() for name in names], dtype=np.int64)
+    return ordinals[inverse]
+
+
+# Function to get one sortable int64 key per (expiry, strike) row. Only for ordering and matching rows;
+# the expiry of a row comes from expiryOrdinals, never back out of the key.
+def strikeKeys(expiry, strike, ordinals=None):
+    if ordinals is None:
+        ordinals = expiryOrdinals(expiry)
+    return ordinals * KEY_SCALE + np.round(np.asarray(strike) * 100).astype(np.int64)
+
+
+# Keeps the last snapshot of every symbol in memory so changes are computed here instead of being read
+# back from a sink. Futures levels are kept per (symbol, frame) where frame is TICK or a bar length
+# in minutes; per-strike levels of the chain (or its strike window) are kept as key-sorted arrays per symbol.
+# checkpoint() saves everything to one .npz file that a restarted collector loads again, together with
+# the day of every symbol's baseline so a restart mid-session does not start the day over.
+class StateStore:
+    def __init__(self, path=None):
+        self.path = path
+        self.futures = {}
+        self.chains = {}
+        self.baselines = {}
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load()
+
+    # Function to make snap the baseline of every frame of its symbol, all changes are 0
+    def resetFutures(self, symbol, snap, frames):
+        with self.lock:
+            for frame in (TICK,) + tuple(frames):
+                self.futures[(symbol, str(frame))] = {name: snap[name] for name in FUTURES_FIELDS + ("currTime",)}
+            self.baselines[symbol] = snap["timestamp"].date()
+        return dict({name: 0 for name in CHANGE_FIELDS}, lastTime=snap["currTime"])
+
+    # Function to get the day symbol's baseline was last written, None if never
+    def baselineDay(self, symbol):
+        return self.baselines.get(symbol)
+
+    # Function to get changes of values against the previous row of the same frame and remember values.
+    # Also returns lastTime, the label of that previous row.
+    def futuresChanges(self, symbol, frame, values):
+        key = (symbol, str(frame))
+        with self.lock:
+            previous = self.futures.get(key)
+            self.futures[key] = {name: values[name] for name in FUTURES_FIELDS + ("currTime",)}
+        if previous is None:
+            return dict({name: 0 for name in CHANGE_FIELDS}, lastTime="00:00")
+        changes = {change: values[name] - previous[name] for name, change in zip(FUTURES_FIELDS, CHANGE_FIELDS)}
+        changes["lastTime"] = previous["currTime"]
+        return changes
+
+    # Function to get per-strike changes of OI and LTP since the previous chain of the symbol, aligned
+    # with the rows of chain, and remember the chain. Changes are computed on the whole parsed chain,
+    # which a strike window keeps (see chain_parser.OptionChainTable.levels), so a strike moving into the
+    # window still gets its change; only strikes NSE did not list on the previous tick get 0.
+    def chainChanges(self, symbol, chain):
+        # Chain rows are already in key order (see chain_parser.OptionChainTable)
+        current, rows = chain.levels()
+        keys = current["keys"]
+        with self.lock:
+            previous = self.chains.get(symbol)
+            self.chains[symbol] = current
+        if previous is None or len(previous["keys"]) == 0:
+            return {name + "Delta": np.zeros_like(getattr(chain, name)) for name in STRIKE_FIELDS}
+        idx = np.searchsorted(previous["keys"], keys)
+        idx = np.minimum(idx, len(previous["keys"]) - 1)
+        found = previous["keys"][idx] == keys
+        deltas = {}
+        for name in STRIKE_FIELDS:
+            values = current[name]
+            delta = np.where(found, values - previous[name][idx], 0).astype(values.dtype)
+            deltas[name + "Delta"] = delta if rows is None else delta[rows]
+        return deltas
+
+    def checkpoint(self):
+        if not self.path:
+            return
+        with self.lock:
+            arrays = {"futures": np.array(json.dumps([[k[0], k[1], v] for k, v in self.futures.items()])),
+                      "baselines": np.array(json.dumps({k: v.isoformat() for k, v in self.baselines.items()}))}
+            for symbol, state in self.chains.items():
+                for name, values in state.items():
+                    arrays["chain|" + symbol + "|" + name] = values
+            # Still under the lock: concurrent checkpoints would write the same tmp file and move it half written
+            tmp = self.path + ".tmp.npz"
+            np.savez(tmp, **arrays)
+            os.replace(tmp, self.path)
+
+    def load(self):
+        with np.load(self.path) as data:
+            self.futures = {(symbol, frame): values for symbol, frame, values in json.loads(str(data["futures"]))}
+            if "baselines" in data.files:
+                self.baselines = {k: date.fromisoformat(v) for k, v in json.loads(str(data["baselines"])).items()}
+            for name in data.files:
+                if name.startswith("chain|"):
+                    _, symbol, field = name.split("|")
+                    self.chains.setdefault(symbol, {})[field] = data[name]